@@ -0,0 +1,99 @@
+#
+# Make anonymized benchmark samples from Jira dumps
+# Usage:
+#   python bench/anonymize_dumps.py --issues <issue number list>
+#
+
+import argparse
+from pathlib import Path
+import re
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from common import JIRA_DUMP_DIRNAME, jira_dump_file, jira_issue_id
+from dump_store import open_jira_dump_store
+from jira_util import JIRA_FIELDS, ACTIVITY_BOTS
+import json_util
+
+SAMPLES_DIRNAME = "samples"
+# accounts that the converter looks at (e.g. extract_activity()) and that are not persons
+KEEP_ACCOUNTS = ACTIVITY_BOTS
+# personal data in user objects
+DROP_USER_KEYS = {"emailAddress", "avatarUrls", "self", "accountId", "timeZone"}
+
+
+class Anonymizer(object):
+    """Replaces account names and display names with "userN" / "User N", consistently across issues
+    """
+    def __init__(self):
+        self.names: dict[str, str] = {}
+        self.disp_names: dict[str, str] = {}
+
+    def user(self, o: dict) -> dict:
+        name = o.get("name", "")
+        if name in KEEP_ACCOUNTS:
+            return {k: v for (k, v) in o.items() if k not in DROP_USER_KEYS}
+        if name not in self.names:
+            self.names[name] = f"user{len(self.names) + 1}"
+        anon = self.names[name]
+        if o.get("displayName"):
+            self.disp_names[o["displayName"]] = f"User {anon[4:]}"
+        res = {k: v for (k, v) in o.items() if k not in DROP_USER_KEYS}
+        res.update({k: anon for k in ["name", "key"] if k in o})
+        if "displayName" in o:
+            res["displayName"] = f"User {anon[4:]}"
+        return res
+
+    def walk(self, o):
+        if isinstance(o, dict):
+            if "name" in o and "displayName" in o:
+                return self.user(o)
+            return {k: self.walk(v) for (k, v) in o.items() if k != "self"}
+        if isinstance(o, list):
+            return [self.walk(x) for x in o]
+        return o
+
+    def text(self, s):
+        """Replace mentions ([~name]) and display names in texts; call after walking all issues so that all users are known
+        """
+        if isinstance(s, dict):
+            return {k: self.text(v) for (k, v) in s.items()}
+        if isinstance(s, list):
+            return [self.text(x) for x in s]
+        if not isinstance(s, str):
+            return s
+        s = re.sub(r"\[~([^\]]+)\]", lambda m: f"[~{self.names.get(m.group(1), 'user0')}]", s)
+        for disp_name in sorted(self.disp_names.keys(), key=len, reverse=True):
+            s = s.replace(disp_name, self.disp_names[disp_name])
+        return s
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--issues', type=int, required=True, nargs='+', help='Jira issue number list to be sampled')
+    args = parser.parse_args()
+
+    dump_dir = Path(__file__).resolve().parent.parent.joinpath(JIRA_DUMP_DIRNAME)
+    if not dump_dir.exists():
+        print(f"Jira dump dir not exists: {dump_dir}")
+        sys.exit(1)
+    dump_store = open_jira_dump_store(dump_dir)
+    samples_dir = Path(__file__).resolve().parent.joinpath(SAMPLES_DIRNAME)
+    samples_dir.mkdir(exist_ok=True)
+
+    anonymizer = Anonymizer()
+    issues = []
+    for num in args.issues:
+        o = dump_store.read(num)
+        if not o:
+            print(f"Jira dump not found: {jira_issue_id(num)}")
+            continue
+        # only the fields read by the converter; rendered fields would need to be anonymized separately
+        fields = {k: v for (k, v) in o.get("fields", {}).items() if k in JIRA_FIELDS}
+        issues.append((num, {"id": o.get("id"), "key": o.get("key"), "fields": anonymizer.walk(fields)}))
+    for (num, o) in issues:
+        o["fields"] = anonymizer.text(o["fields"])
+        sample_file = jira_dump_file(samples_dir, num)
+        json_util.dump_file(sample_file, o, pretty=True)
+        print(f"Sample written: {sample_file}")
@@ -0,0 +1,352 @@
+#
+# Benchmarks of the conversion hot paths on the anonymized sample dumps (bench/samples) and synthetic stress inputs
+# Usage:
+#   python bench/bench_conversion.py
+#   python bench/bench_conversion.py --save-baseline
+#   python bench/bench_conversion.py --filter convert_text --repeat 10 --threshold 0.3
+#   python bench/bench_conversion.py --rounds 5
+#
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+import gc
+import importlib.metadata
+import json
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from dump_store import DumpStore, open_jira_dump_store
+from jira_util import parse_issue, extract_activity, convert_text, embed_gh_issue_link, REGEX_JIRA_KEY
+from jira2github_import import convert_issue_data
+import json_util
+
+SAMPLES_DIRNAME = "samples"
+BASELINE_FILENAME = "baseline.json"
+# relative slowdown (throughput) or growth (peak memory) that fails the comparison; above the spread of unchanged code on a shared single-CPU VM
+# (up to 43% slower with the default rounds), so that only real regressions fail
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_REPEAT = 3
+# the whole suite is run this many times and the median of each benchmark is compared, so that a single slow or fast run does not decide the result
+DEFAULT_ROUNDS = 3
+# fast benchmarks are called repeatedly in each timed run until it takes at least this many seconds
+MIN_RUN_TIME = 0.2
+# timed runs of the calibration loop
+CALIBRATION_REPEAT = 5
+
+
+@dataclass
+class Benchmark(object):
+    name: str
+    func: Callable[[], None]
+    # number of items (texts, issues) and input bytes processed by one call of func
+    ops: int
+    nbytes: int
+
+
+class MemoryDumpStore(DumpStore):
+    """Dumps held in memory (stress inputs)
+    """
+    def __init__(self, issues: dict[int, dict]):
+        self.issues = issues
+
+    def exists(self, num: int) -> bool:
+        return num in self.issues
+
+    def read(self, num: int) -> Optional[dict]:
+        return self.issues.get(num)
+
+    def write(self, num: int, o: dict) -> str:
+        self.issues[num] = o
+        return self.location(num)
+
+    def numbers(self) -> list[int]:
+        return sorted(self.issues.keys())
+
+    def location(self, num: int) -> str:
+        return f"memory:{num}"
+
+    def size(self, num: int) -> int:
+        return len(json_util.dumps(self.issues[num])) if num in self.issues else 0
+
+
+def issue_texts(o: dict) -> list[str]:
+    issue = parse_issue(o)
+    return ([issue.description] if issue.description else []) + [c.body for c in issue.comments if c.body]
+
+
+def stress_nesting(depth: int = 6, repeat: int = 3) -> str:
+    """Deeply nested lists, quotes, panels and code blocks
+    """
+    items = []
+    for d in range(1, depth + 1):
+        items.append("*" * d + f" item at depth {d} with *bold* and {{{{code}}}} and a [link|https://example.com/{d}]")
+        items.append("#" * d + f" numbered item at depth {d} -strike- +under+")
+    lists = "\n".join(items)
+    block = f"""{{panel:title=Panel}}
+{{quote}}
+bq. quoted line
+{lists}
+{{quote}}
+{{code:java}}
+for (int i = 0; i < {depth}; i++) {{ nested(i); }}
+{{code}}
+{{panel}}
+"""
+    return "\n".join([block] * repeat)
+
+
+def stress_mentions(n: int = 60) -> str:
+    """Many user mentions, links, attachments and Jira keys
+    """
+    parts = []
+    for i in range(n):
+        parts.append(f"[~user{i % 30}] see [patch {i}|https://issues.apache.org/jira/browse/LUCENE-{9000 + i}] and [^LUCENE-{9000 + i}.patch], cc @user{i % 7}")
+    return "\n".join(parts)
+
+
+def stress_table(rows: int = 30, cols: int = 6) -> str:
+    header = "||" + "||".join(f"col{c}" for c in range(cols)) + "||"
+    body = ["|" + "|".join(f"r{r}c{c} *{r * c}*" for c in range(cols)) + "|" for r in range(rows)]
+    return "\n".join([header] + body)
+
+
+def stress_thread(o: dict, num_comments: int) -> dict:
+    """Copy of the issue with a very long comment thread (the comments are repeated)
+    """
+    comments = o["fields"]["comment"]["comments"]
+    res = json.loads(json.dumps(o))
+    res["fields"]["comment"]["comments"] = [comments[i % len(comments)] for i in range(num_comments)]
+    return res
+
+
+def stress_worklogs(o: dict, num_worklogs: int) -> dict:
+    res = json.loads(json.dumps(o))
+    res["fields"]["worklog"] = {"worklogs": [{
+        "author": {"name": "githubbot"},
+        "comment": f"user{i % 9} opened a new pull request #{i}:\nURL: https://github.com/apache/lucene/pull/{i}\n\n   " + "Some description of the change. " * 20,
+    } if i % 3 == 0 else {
+        "author": {"name": "githubbot"},
+        "comment": f"user{i % 9} commented on pull request #{i}:\nURL: https://github.com/apache/lucene/pull/{i}#issuecomment-{i}\n\n   Looks good.",
+    } for i in range(num_worklogs)]}
+    return res
+
+
+def benchmarks(samples: DumpStore) -> list[Benchmark]:
+    issues = [samples.read(num) for num in samples.numbers()]
+    longest = max(issues, key=lambda o: len(o["fields"]["comment"]["comments"]))
+    long_thread = stress_thread(longest, 60)
+    res = []
+
+    def texts_benchmark(name: str, texts: list[str]):
+        res.append(Benchmark(name, lambda: [convert_text(t) for t in texts], len(texts), sum(len(t.encode("utf-8")) for t in texts)))
+
+    texts_benchmark("convert_text/samples", [t for o in issues for t in issue_texts(o)])
+    texts_benchmark("convert_text/stress-nesting", [stress_nesting()])
+    texts_benchmark("convert_text/stress-mentions", [stress_mentions()])
+    texts_benchmark("convert_text/stress-table", [stress_table()])
+
+    def embed_benchmark(name: str, texts: list[str]):
+        issue_id_map = {m[1:]: str(i) for (i, m) in enumerate(sorted(set(k for t in texts for k in REGEX_JIRA_KEY.findall(t))))}
+        res.append(Benchmark(name, lambda: [embed_gh_issue_link(t, issue_id_map) for t in texts], len(texts), sum(len(t.encode("utf-8")) for t in texts)))
+
+    embed_benchmark("embed_gh_issue_link/samples", [t for o in issues for t in issue_texts(o)])
+    embed_benchmark("embed_gh_issue_link/stress-keys", [" ".join(f"see LUCENE-{i} and LUCENE-{i * 7}." for i in range(1, 2001))])
+
+    def activity_benchmark(name: str, dumps: list[dict]):
+        inputs = [(o["fields"].get("worklog", {}).get("worklogs", []), parse_issue(o).comments) for o in dumps]
+        nbytes = sum(len(json.dumps(o["fields"].get("worklog", {})).encode("utf-8")) + len(json.dumps(o["fields"].get("comment", {})).encode("utf-8")) for o in dumps)
+        res.append(Benchmark(name, lambda: [extract_activity(worklogs, comments) for (worklogs, comments) in inputs], len(inputs), nbytes))
+
+    activity_benchmark("extract_activity/samples", issues)
+    activity_benchmark("extract_activity/stress-worklogs", [stress_worklogs(issues[0], 3000)])
+
+    res.append(Benchmark("parse_issue/samples", lambda: [parse_issue(o) for o in issues], len(issues), sum(len(json.dumps(o).encode("utf-8")) for o in issues)))
+    res.append(Benchmark("parse_issue/stress-thread", lambda: parse_issue(long_thread), 1, len(json.dumps(long_thread).encode("utf-8"))))
+
+    def issue_benchmark(name: str, store: DumpStore):
+        nums = store.numbers()
+        nbytes = sum(len(json.dumps(store.read(num)).encode("utf-8")) for num in nums)
+        res.append(Benchmark(name, lambda: [convert_issue_data(num, store, {}, "bench/attachments", "main") for num in nums], len(nums), nbytes))
+
+    def json_benchmarks(name: str, objects: list[dict]):
+        encoded = [json_util.dumps(o) for o in objects]
+        nbytes = sum(len(x) for x in encoded)
+        res.append(Benchmark(f"json_loads/{name}", lambda: [json_util.loads(x) for x in encoded], len(objects), nbytes))
+        res.append(Benchmark(f"json_dumps_compact/{name}", lambda: [json_util.dumps(o) for o in objects], len(objects), nbytes))
+        res.append(Benchmark(f"json_dumps_pretty/{name}", lambda: [json_util.dumps(o, pretty=True) for o in objects], len(objects), nbytes))
+
+    json_benchmarks("samples", issues)
+    json_benchmarks("stress-thread", [long_thread])
+
+    issue_benchmark("convert_issue/samples", samples)
+    issue_benchmark("convert_issue/stress-thread", MemoryDumpStore({int(long_thread["key"].split("-")[1]): long_thread}))
+    return res
+
+
+def calibration_loop():
+    """Fixed pure-Python work (string formatting, dict updates, iteration and a regex scan) that measures the speed of the machine and the interpreter
+    """
+    d = {}
+    for i in range(20000):
+        key = f"LUCENE-{i}"
+        d[key] = len(key) * i
+    total = sum(v for (k, v) in d.items() if k.endswith("7"))
+    return (total, len(REGEX_JIRA_KEY.findall(" ".join(d.keys()))))
+
+
+def calibrate(repeat: int = CALIBRATION_REPEAT) -> float:
+    """Calibration loops per second; throughputs are compared with the baseline relative to this, so the baseline can be taken on another machine
+    """
+    return measure(Benchmark("calibration", calibration_loop, 1, 0), repeat)["ops_per_sec"]
+
+
+def measure(b: Benchmark, repeat: int) -> dict:
+    """Best wall time per call of the repeated runs and peak traced memory of one call
+
+    The warm-up call also decides how many calls make a timed run.
+    """
+    start = time.perf_counter()
+    b.func()
+    number = max(1, int(MIN_RUN_TIME / max(time.perf_counter() - start, 1e-6)))
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            b.func()
+        times.append((time.perf_counter() - start) / number)
+    best = min(times)
+    # garbage left by the timed runs would otherwise be collected at random points during the traced call
+    gc.collect()
+    tracemalloc.start()
+    b.func()
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ops_per_sec": b.ops / best,
+        "kb_per_sec": b.nbytes / best / 1024,
+        "peak_kb": peak / 1024,
+    }
+
+
+def measure_isolated(name: str, repeat: int) -> tuple[float, dict]:
+    """Calibration and results of a benchmark run in a fresh interpreter (see `--run-one`)
+
+    Fast benchmarks settle in faster or slower states depending on what ran before them in the same process (heap layout, caches),
+    so each benchmark gets its own process.
+    """
+    out = subprocess.run([sys.executable, str(Path(__file__).resolve()), "--run-one", name, "--repeat", str(repeat)], check=True, capture_output=True, text=True).stdout
+    o = json.loads(out.strip().splitlines()[-1])
+    return (o["calibration"], o["result"])
+
+
+def median_result(runs: list[dict]) -> dict:
+    """Median throughput and peak memory of the rounds of a benchmark
+    """
+    return {key: statistics.median(r[key] for r in runs) for key in ("ops_per_sec", "kb_per_sec", "peak_kb")}
+
+
+def relative_speed(r: dict, base: dict, calibration: float, base_calibration: float) -> float:
+    """Throughput relative to the baseline, normalized by the calibration of each run (1.0 = as fast as the baseline)
+    """
+    return (r["ops_per_sec"] / calibration) / (base["ops_per_sec"] / base_calibration)
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], calibration: float, base_calibration: float, threshold: float) -> list[str]:
+    """Names of the benchmarks that are slower (normalized by the calibration) or use more memory than the baseline by more than the threshold
+    """
+    regressions = []
+    for (name, r) in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if relative_speed(r, base, calibration, base_calibration) < 1 - threshold or r["peak_kb"] > base["peak_kb"] * (1 + threshold):
+            regressions.append(name)
+    return regressions
+
+
+def environment() -> dict:
+    try:
+        jira2markdown_version = importlib.metadata.version("jira2markdown")
+    except importlib.metadata.PackageNotFoundError:
+        jira2markdown_version = "unknown"
+    return {"python": platform.python_version(), "machine": platform.machine(), "jira2markdown": jira2markdown_version, "json": json_util.backend()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filter', type=str, dest='filter', required=False, help='Run only benchmarks whose names match this regular expression')
+    parser.add_argument('--repeat', type=int, dest='repeat', required=False, default=DEFAULT_REPEAT, help='Number of timed runs of each benchmark (the best is taken)')
+    parser.add_argument('--rounds', type=int, dest='rounds', required=False, default=DEFAULT_ROUNDS, help='Number of runs of the whole suite (the median of each benchmark is taken)')
+    parser.add_argument('--threshold', type=float, dest='threshold', required=False, default=DEFAULT_THRESHOLD, help='Allowed relative slowdown / memory growth against the baseline (e.g. 0.25 = 25%%)')
+    parser.add_argument('--baseline', type=str, dest='baseline', required=False, help='Baseline file (default: bench/baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results to the baseline file instead of comparing')
+    # internal: run one benchmark and print its calibration and results as JSON (see measure_isolated())
+    parser.add_argument('--run-one', type=str, dest='run_one', required=False, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    bench_dir = Path(__file__).resolve().parent
+    baseline_file = Path(args.baseline) if args.baseline else bench_dir.joinpath(BASELINE_FILENAME)
+    samples = open_jira_dump_store(bench_dir.joinpath(SAMPLES_DIRNAME))
+
+    if args.run_one:
+        b = next(b for b in benchmarks(samples) if b.name == args.run_one)
+        calibration = calibrate()
+        print(json.dumps({"calibration": calibration, "result": measure(b, args.repeat)}))
+        sys.exit(0)
+
+    baseline = {}
+    base_calibration = None
+    if baseline_file.exists() and not args.save_baseline:
+        with open(baseline_file) as fp:
+            o = json.load(fp)
+        if o.get("calibration"):
+            baseline = o.get("results", {})
+            base_calibration = o["calibration"]
+        else:
+            print("Warning: the baseline has no calibration and is not compared. Run with --save-baseline.")
+        if o.get("environment") != environment():
+            print(f"Warning: the baseline was taken in a different environment: {o.get('environment')}")
+
+    # the rounds interleave the benchmarks, so that a change of the machine's speed during the run affects all of them alike;
+    # the calibration loop runs before each benchmark and the median is taken, so that a transient load on the machine does not skew all comparisons
+    selected = [b.name for b in benchmarks(samples) if not args.filter or re.search(args.filter, b.name)]
+    (runs, calibrations) = ({name: [] for name in selected}, [])
+    for _ in range(max(1, args.rounds)):
+        for name in selected:
+            (calibration, r) = measure_isolated(name, args.repeat)
+            calibrations.append(calibration)
+            runs[name].append(r)
+    results = {name: median_result(rs) for (name, rs) in runs.items()}
+    calibration = statistics.median(calibrations) if calibrations else 0.0
+    base_calibration = base_calibration or calibration
+    print(f"Calibration: {calibration:.1f} loops/s (baseline: {base_calibration:.1f} loops/s); ops/s diff is normalized by the calibration")
+
+    print(f"{'benchmark':<40} {'ops/s':>10} {'KB/s':>10} {'peak KB':>10} {'ops/s diff':>11} {'peak diff':>10}")
+    for (name, r) in results.items():
+        base = baseline.get(name)
+        ops_diff = f"{relative_speed(r, base, calibration, base_calibration) - 1:+.1%}" if base else "-"
+        peak_diff = f"{r['peak_kb'] / base['peak_kb'] - 1:+.1%}" if base else "-"
+        print(f"{name:<40} {r['ops_per_sec']:>10.1f} {r['kb_per_sec']:>10.1f} {r['peak_kb']:>10.1f} {ops_diff:>11} {peak_diff:>10}")
+
+    if args.save_baseline:
+        with open(baseline_file, "w") as fp:
+            json.dump({"environment": environment(), "calibration": calibration, "results": results}, fp, indent=2)
+        print(f"Baseline written in {baseline_file}")
+        sys.exit(0)
+    if not baseline:
+        print("No baseline to compare with. Run with --save-baseline first.")
+        sys.exit(0)
+    regressions = compare(results, baseline, calibration, base_calibration, args.threshold)
+    if regressions:
+        print(f"Regressions beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"No regressions beyond {args.threshold:.0%}.")
@@ -0,0 +1,111 @@
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from logging import Logger
+from pathlib import Path
+from typing import Optional
+import os
+import re
+
+from common import RateLimiter
+from http_util import RequestStats, jira_request
+from jira_util import Attachment, attachment, latest_attachments
+import json_util
+
+
+REGEX_SIZE = re.compile(r"^(\d+(?:\.\d+)?)\s*([KMG]?)B?$", re.IGNORECASE)
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+# skip reasons
+REASON_TOO_LARGE = "too large"
+REASON_MIME_DENIED = "MIME type not allowed"
+REASON_OLDER_VERSION = "older version"
+
+
+def list_attachments(o: dict) -> list[Attachment]:
+    """All versions of all attached files with complete metadata
+    """
+    return [a for a in map(attachment, o.get("fields").get("attachment") or []) if a]
+
+
+def select_attachments(o: dict) -> list[Attachment]:
+    """Select the latest version of each attached file
+    """
+    return [a for (a, _) in latest_attachments(list_attachments(o))]
+
+
+def parse_size(s: str) -> int:
+    """Parse a size such as "1048576", "500K", "10MB" or "1.5G" into bytes
+    """
+    m = REGEX_SIZE.match(s.strip())
+    if not m:
+        raise ValueError(f"Invalid size: {s}")
+    return int(float(m.group(1)) * SIZE_UNITS[m.group(2).upper()])
+
+
+def format_size(nbytes: int) -> str:
+    for unit in ["", "K", "M"]:
+        if nbytes < 1024:
+            return f"{nbytes:.1f} {unit}B" if unit else f"{nbytes} B"
+        nbytes /= 1024
+    return f"{nbytes:.1f} GB"
+
+
+@dataclass
+class AttachmentPolicy(object):
+    """Rules deciding which attachments are downloaded; MIME type patterns may contain wildcards (e.g. "image/*")
+    """
+    max_size: Optional[int] = None
+    allow_mime: list[str] = field(default_factory=list)
+    deny_mime: list[str] = field(default_factory=list)
+
+    def skip_reason(self, a: Attachment) -> Optional[str]:
+        if self.max_size is not None and a.size > self.max_size:
+            return f"{REASON_TOO_LARGE}, {format_size(a.size)}"
+        if self.allow_mime and not any(fnmatch(a.mime_type, p) for p in self.allow_mime):
+            return f"{REASON_MIME_DENIED}, {a.mime_type}"
+        if any(fnmatch(a.mime_type, p) for p in self.deny_mime):
+            return f"{REASON_MIME_DENIED}, {a.mime_type}"
+        return None
+
+
+def probe_size(a: Attachment, limiter: RateLimiter, stats: RequestStats, logger: Logger) -> int:
+    """Get the attachment size by a HEAD request (for attachments without size in the metadata)
+
+    The request is retried if Jira throttles it and recorded in `stats` under "attachment".
+    """
+    res = jira_request("HEAD", a.content, limiter, "attachment", stats, logger, allow_redirects=True)
+    if res.status_code != 200:
+        logger.warning(f"Can't probe {a.content}. status code={res.status_code}")
+        return 0
+    return int(res.headers.get("Content-Length", 0))
+
+
+class AttachmentPlan(object):
+    """Attachments excluded from download by the planning pass, with the reasons
+
+    Written by `plan_attachments.py`; the downloader skips the listed attachments and the converter notes them in the attachment list.
+    """
+    def __init__(self, plan_file: Path):
+        self.plan_file = plan_file
+        self.policy: dict = {}
+        self.skipped: dict[str, dict[str, dict]] = {}
+        if plan_file.exists():
+            o = json_util.load_file(plan_file)
+            self.policy = o.get("policy", {})
+            self.skipped = o.get("skipped", {})
+
+    def skip(self, num: int, a: Attachment, reason: str):
+        self.skipped.setdefault(str(num), {})[a.id] = {"filename": a.filename, "size": a.size, "mime_type": a.mime_type, "reason": reason}
+
+    def is_skipped(self, num: int, attachment_id: str) -> bool:
+        return attachment_id in self.skipped.get(str(num), {})
+
+    def skipped_files(self, num: int) -> dict[str, str]:
+        """File name -> reason for the skipped attachments of the issue
+        """
+        return {x["filename"]: x["reason"] for x in self.skipped.get(str(num), {}).values()}
+
+    def save(self):
+        tmp_file = self.plan_file.with_name(self.plan_file.name + ".tmp")
+        json_util.dump_file(tmp_file, {"policy": self.policy, "skipped": self.skipped}, pretty=True)
+        os.replace(tmp_file, self.plan_file)
@@ -0,0 +1,105 @@
+from pathlib import Path
+from typing import Optional
+import hashlib
+import os
+import shutil
+import threading
+
+from common import ATTACHMENT_STORE_DIRNAME
+import json_util
+
+
+STORE_VERSION = 1
+STORE_MANIFEST_FILENAME = "attachments.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fp:
+        while True:
+            chunk = fp.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class AttachmentStore(object):
+    """Content-addressed store of attachment files (e.g., attachments/.store/objects/ab/ab12...)
+
+    Each distinct content is stored once by its SHA-256; the per-issue files (attachments/LUCENE-N/<file>) are hardlinks
+    to the stored objects (or copies where hardlinks are not supported), so the layout seen by the converter and the attachments repo does not change.
+    The store manifest maps Jira attachment ids to content hashes so that files known by a previous run are not downloaded again.
+    Updates are thread-safe; call `save()` to persist the manifest.
+    """
+    def __init__(self, att_data_dir: Path):
+        self.store_dir = att_data_dir.joinpath(ATTACHMENT_STORE_DIRNAME)
+        self.objects_dir = self.store_dir.joinpath("objects")
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_file = self.store_dir.joinpath(STORE_MANIFEST_FILENAME)
+        self.lock = threading.Lock()
+        self.attachments: dict[str, dict] = {}
+        self.deduplicated = 0
+        if self.manifest_file.exists():
+            o = json_util.load_file(self.manifest_file)
+            if o.get("version") == STORE_VERSION:
+                self.attachments = o.get("attachments", {})
+
+    def object_file(self, sha256: str) -> Path:
+        return self.objects_dir.joinpath(sha256[:2], sha256)
+
+    def lookup(self, attachment_id: str) -> Optional[str]:
+        """Content hash of the attachment if it is in the store
+        """
+        with self.lock:
+            entry = self.attachments.get(attachment_id)
+        if entry and self.object_file(entry["sha256"]).exists():
+            return entry["sha256"]
+        return None
+
+    def add(self, attachment_id: str, attachment_file: Path) -> str:
+        """Move a downloaded file into the store and replace it with a link to the stored object
+        """
+        sha256 = file_sha256(attachment_file)
+        object_file = self.object_file(sha256)
+        with self.lock:
+            if object_file.exists():
+                if not os.path.samefile(object_file, attachment_file):
+                    self.deduplicated += 1
+            else:
+                object_file.parent.mkdir(exist_ok=True)
+                os.replace(attachment_file, object_file)
+            self.attachments[attachment_id] = {"sha256": sha256, "size": object_file.stat().st_size}
+        self.link(sha256, attachment_file)
+        return sha256
+
+    def link(self, sha256: str, attachment_file: Path):
+        """Make the attachment file point to the stored object
+        """
+        object_file = self.object_file(sha256)
+        if attachment_file.exists() and os.path.samefile(object_file, attachment_file):
+            return
+        tmp_file = attachment_file.with_name(f"{attachment_file.name}.{threading.get_ident()}.tmp")
+        try:
+            os.link(object_file, tmp_file)
+        except OSError:
+            # hardlinks are not supported (e.g., on another file system)
+            shutil.copyfile(object_file, tmp_file)
+        os.replace(tmp_file, attachment_file)
+
+    def save(self):
+        with self.lock:
+            tmp_file = self.manifest_file.with_name(self.manifest_file.name + ".tmp")
+            json_util.dump_file(tmp_file, {"version": STORE_VERSION, "attachments": self.attachments})
+            os.replace(tmp_file, self.manifest_file)
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            hashes = {e["sha256"]: e["size"] for e in self.attachments.values()}
+            return {
+                "attachments": len(self.attachments),
+                "objects": len(hashes),
+                "bytes": sum(hashes.values()),
+                "deduplicated": self.deduplicated,
+            }
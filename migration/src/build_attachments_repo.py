@@ -0,0 +1,242 @@
+#
+# Commit downloaded attachments to the attachments repository with git fast-import (no working tree needed)
+# Usage:
+#   python src/build_attachments_repo.py --repo <path to the attachments repository>
+#   python src/build_attachments_repo.py --repo <path to the attachments repository> --branch <branch> --dry-run
+#
+
+import argparse
+from pathlib import Path
+from typing import BinaryIO, Optional
+import hashlib
+import os
+import re
+import subprocess
+import sys
+import time
+
+from common import LOG_DIRNAME, JIRA_ATTACHMENTS_DIRNAME, ATTACHMENT_STORE_DIRNAME, logging_setup
+import json_util
+
+log_dir = Path(__file__).resolve().parent.parent.joinpath(LOG_DIRNAME)
+logger = logging_setup(log_dir, "build_attachments_repo")
+
+# attachment_url() in jira2github_import.py links to files under this directory in the repository
+REPO_ATTACHMENTS_DIR = "attachments"
+REGEX_ISSUE_DIR = re.compile(r"^LUCENE-\d+$")
+# leftovers of interrupted downloads
+TEMP_SUFFIXES = (".part", ".tmp")
+COPY_CHUNK_SIZE = 1024 * 1024
+
+BLOB_ID_CACHE_VERSION = 1
+BLOB_ID_CACHE_FILENAME = "git-blob-ids.json"
+
+
+def git(repo: Path, *args: str) -> bytes:
+    return subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True).stdout
+
+
+def branch_exists(repo: Path, branch: str) -> bool:
+    return subprocess.run(["git", "-C", str(repo), "rev-parse", "--verify", "--quiet", f"refs/heads/{branch}"], capture_output=True).returncode == 0
+
+
+def list_committed_files(repo: Path, branch: str) -> dict[str, tuple[str, int]]:
+    """Blob id and size of each file under the attachments dir in the branch
+    """
+    res = {}
+    out = git(repo, "ls-tree", "-r", "-z", "--long", f"refs/heads/{branch}", "--", REPO_ATTACHMENTS_DIR)
+    for entry in out.split(b"\0"):
+        if not entry:
+            continue
+        (meta, path) = entry.split(b"\t", maxsplit=1)
+        (_, _, blob_id, size) = meta.split()
+        res[path.decode("utf-8")] = (blob_id.decode("ascii"), int(size))
+    return res
+
+
+def git_blob_id(file: Path) -> str:
+    """Object id of the file's content as computed by `git hash-object`
+    """
+    h = hashlib.sha1(f"blob {file.stat().st_size}\0".encode("ascii"))
+    with open(file, "rb") as fp:
+        while True:
+            chunk = fp.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_key(st: os.stat_result) -> list[int]:
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+class BlobIdCache(object):
+    """Git blob ids of the attachment files, so that unchanged files are not read again to compare them with the committed files
+
+    A cached id is used while the file's size, mtime and inode are unchanged (a re-downloaded file is a new inode in the attachment store).
+    Call `save()` to persist the cache.
+    """
+    def __init__(self, cache_file: Path):
+        self.cache_file = cache_file
+        self.files: dict[str, list] = {}
+        if cache_file.exists():
+            o = json_util.load_file(cache_file)
+            if o.get("version") == BLOB_ID_CACHE_VERSION:
+                self.files = o.get("files", {})
+
+    def blob_id(self, path: str, f: Path) -> str:
+        key = file_key(f.stat())
+        entry = self.files.get(path)
+        if entry and entry[:3] == key:
+            return entry[3]
+        blob_id = git_blob_id(f)
+        self.files[path] = key + [blob_id]
+        return blob_id
+
+    def record(self, path: str, f: Path, blob_id: str):
+        self.files[path] = file_key(f.stat()) + [blob_id]
+
+    def save(self):
+        tmp_file = self.cache_file.with_name(self.cache_file.name + ".tmp")
+        json_util.dump_file(tmp_file, {"version": BLOB_ID_CACHE_VERSION, "files": self.files})
+        os.replace(tmp_file, self.cache_file)
+
+
+def collect_attachment_files(att_data_dir: Path) -> list[tuple[str, Path]]:
+    """(path in the repository, local file) of all downloaded attachments
+    """
+    files = []
+    for issue_dir in sorted(att_data_dir.iterdir()):
+        if not (issue_dir.is_dir() and REGEX_ISSUE_DIR.match(issue_dir.name)):
+            continue
+        for f in sorted(issue_dir.iterdir()):
+            if f.is_file() and not f.name.endswith(TEMP_SUFFIXES):
+                files.append((f"{REPO_ATTACHMENTS_DIR}/{issue_dir.name}/{f.name}", f))
+    return files
+
+
+def select_changed_files(files: list[tuple[str, Path]], committed: dict[str, tuple[str, int]], cache: BlobIdCache) -> list[tuple[str, Path]]:
+    changed = []
+    for (path, f) in files:
+        entry = committed.get(path)
+        if entry:
+            (blob_id, size) = entry
+            # compare contents only if the sizes are the same; the blob id is read from the cache unless the file changed
+            if size == f.stat().st_size and blob_id == cache.blob_id(path, f):
+                continue
+        changed.append((path, f))
+    return changed
+
+
+def quote_path(path: str) -> str:
+    if path.startswith('"') or "\n" in path:
+        return '"' + path.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+    return path
+
+
+def write_fast_import_stream(out: BinaryIO, files: list[tuple[str, Path]], branch: str, committer: str, message: str, parent: bool) -> dict[str, str]:
+    """Write blobs and a single commit that adds/updates the files on top of the branch head; returns the blob id of each path
+
+    Hardlinked files (identical contents in the attachment store) are sent once.
+    """
+    marks: dict[tuple[int, int], tuple[int, str]] = {}
+    file_marks = []
+    blob_ids = {}
+    mark = 0
+    for (path, f) in files:
+        st = f.stat()
+        inode = (st.st_dev, st.st_ino)
+        if inode not in marks:
+            mark += 1
+            out.write(f"blob\nmark :{mark}\ndata {st.st_size}\n".encode("ascii"))
+            # the blob id is computed from the streamed bytes, so the file is read once
+            h = hashlib.sha1(f"blob {st.st_size}\0".encode("ascii"))
+            with open(f, "rb") as fp:
+                while True:
+                    chunk = fp.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    h.update(chunk)
+            out.write(b"\n")
+            marks[inode] = (mark, h.hexdigest())
+        file_marks.append((path, marks[inode][0]))
+        blob_ids[path] = marks[inode][1]
+
+    msg = message.encode("utf-8")
+    out.write(f"commit refs/heads/{branch}\ncommitter {committer} {int(time.time())} +0000\ndata {len(msg)}\n".encode("utf-8"))
+    out.write(msg + b"\n")
+    if parent:
+        out.write(f"from refs/heads/{branch}^0\n".encode("utf-8"))
+    for (path, m) in file_marks:
+        out.write(f"M 100644 :{m} {quote_path(path)}\n".encode("utf-8"))
+    out.write(b"\n")
+    return blob_ids
+
+
+def committer_ident(repo: Path, committer: Optional[str]) -> str:
+    if committer:
+        return committer
+    # "Name <email> timestamp tz"
+    ident = git(repo, "var", "GIT_COMMITTER_IDENT").decode("utf-8").strip()
+    return ident.rsplit(" ", 2)[0]
+
+
+def fast_import(repo: Path, files: list[tuple[str, Path]], branch: str, committer: str, message: str) -> dict[str, str]:
+    """Commit the files with `git fast-import`; returns the blob id of each committed path
+    """
+    parent = branch_exists(repo, branch)
+    proc = subprocess.Popen(["git", "-C", str(repo), "fast-import", "--quiet"], stdin=subprocess.PIPE)
+    try:
+        blob_ids = write_fast_import_stream(proc.stdin, files, branch, committer, message, parent)
+    finally:
+        proc.stdin.close()
+    if proc.wait() != 0:
+        raise RuntimeError(f"git fast-import failed with exit code {proc.returncode}")
+    return blob_ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repo', type=str, dest='repo', required=True, help='Path to the attachments repository (a bare repository is created if not exists)')
+    parser.add_argument('--branch', type=str, dest='branch', required=False, default=os.getenv("GITHUB_ATT_BRANCH", "main"), help='Branch to be updated (default: GITHUB_ATT_BRANCH or "main")')
+    parser.add_argument('--committer', type=str, dest='committer', required=False, help='Committer as "Name <email>" (default: git config)')
+    parser.add_argument('--message', type=str, dest='message', required=False, default='Add Jira attachments', help='Commit message')
+    parser.add_argument('--dry-run', action='store_true', help='Only report the files to be committed')
+    args = parser.parse_args()
+
+    att_data_dir = Path(__file__).resolve().parent.parent.joinpath(JIRA_ATTACHMENTS_DIRNAME)
+    if not att_data_dir.exists():
+        logger.error(f"Attachments dir not exists: {att_data_dir}")
+        sys.exit(1)
+
+    repo = Path(args.repo)
+    if not repo.exists():
+        subprocess.run(["git", "init", "--quiet", "--bare", str(repo)], check=True)
+        git(repo, "symbolic-ref", "HEAD", f"refs/heads/{args.branch}")
+        logger.info(f"Created bare repository {repo}")
+
+    files = collect_attachment_files(att_data_dir)
+    committed = list_committed_files(repo, args.branch) if branch_exists(repo, args.branch) else {}
+    cache_dir = att_data_dir.joinpath(ATTACHMENT_STORE_DIRNAME)
+    cache_dir.mkdir(exist_ok=True)
+    cache = BlobIdCache(cache_dir.joinpath(BLOB_ID_CACHE_FILENAME))
+    changed = select_changed_files(files, committed, cache)
+    cache.save()
+    logger.info(f"{len(files)} attachment files found, {len(changed)} files to be committed to {args.branch} ({len(files) - len(changed)} already committed)")
+    if not changed or args.dry_run:
+        logger.info("Done.")
+        sys.exit(0)
+
+    try:
+        committer = committer_ident(repo, args.committer)
+    except subprocess.CalledProcessError:
+        logger.error("Committer identity is unknown. Please configure git user.name/user.email or pass --committer.")
+        sys.exit(1)
+    blob_ids = fast_import(repo, changed, args.branch, committer, args.message)
+    for (path, f) in changed:
+        cache.record(path, f, blob_ids[path])
+    cache.save()
+    logger.info(f"Committed {len(changed)} files to {args.branch} in {repo}")
+    logger.info("Done.")
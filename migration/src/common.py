@@ -2,6 +2,7 @@ from pathlib import Path
 import logging
 from datetime import datetime
 import functools
+import threading
 import time
 
 
@@ -9,8 +10,16 @@ LOG_DIRNAME = "log"
 
 JIRA_DUMP_DIRNAME = "jira-dump"
 JIRA_ATTACHMENTS_DIRNAME = "attachments"
+# content-addressed attachment store in the attachments dir
+ATTACHMENT_STORE_DIRNAME = ".store"
+JIRA_DUMP_MANIFEST_FILENAME = "manifest.json"
+JIRA_DUMP_INDEX_FILENAME = "index.json"
+ATTACHMENT_PLAN_FILENAME = "attachment-plan.json"
 GITHUB_IMPORT_DATA_DIRNAME = "github-import-data"
 MAPPINGS_DATA_DIRNAME = "mappings-data"
+CONVERT_CACHE_DIRNAME = ".cache"
+CONVERT_CACHE_FILENAME = "convert-cache.sqlite"
+CONVERT_MANIFEST_FILENAME = "convert-manifest.json"
 
 ISSUE_MAPPING_FILENAME = "issue-map.csv"
 ACCOUNT_MAPPING_FILENAME = "account-map.csv"
@@ -111,6 +120,42 @@ class MaxRetryLimitExceedException(Exception):
     pass
 
 
+class RateLimiter(object):
+    """Token bucket rate limiter that can be shared among threads
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        assert rate > 0
+        self.rate = rate
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self) -> float:
+        """Take one token; blocks until it is available and returns the waited seconds
+        """
+        with self.lock:
+            self.__refill()
+            # reserve the token in advance so that waiting threads are served in order
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, sec: float):
+        """Hold back all callers for (at least) the given seconds, e.g. when the server asks us to slow down
+        """
+        with self.lock:
+            self.__refill()
+            self.tokens = min(self.tokens, 0.0) - sec * self.rate
+
+
 ISSUE_TYPE_TO_LABEL_MAP = {
     "Bug": "type:bug",
     "New Feature": "type:new_feature",
@@ -0,0 +1,110 @@
+from pathlib import Path
+from typing import Callable
+import hashlib
+import json
+import sqlite3
+import time
+
+
+DEFAULT_CACHE_SIZE_MB = 1024
+# number of writes between commits; keeps transactions short when several processes share the cache
+COMMIT_INTERVAL = 200
+# number of writes between size checks
+EVICT_CHECK_INTERVAL = 1000
+# evict down to this ratio of the size cap so that eviction does not run on every write
+EVICT_TARGET_RATIO = 0.9
+
+
+class ConvertCache(object):
+    """On-disk cache of converted texts in a SQLite database with a size cap and LRU eviction
+
+    Entries are keyed by a hash of the converter version, the conversion kind, the input text and the attachment replace map,
+    so bumping the converter version (or upgrading jira2markdown) invalidates all entries.
+    Several processes can share one cache file; each process counts its own hits and misses.
+    """
+    def __init__(self, db_file: Path, version: str, max_bytes: int = DEFAULT_CACHE_SIZE_MB * 1024 * 1024):
+        self.db_file = db_file
+        self.version = version
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.pending_writes = 0
+        self.unchecked_writes = 0
+        self.pending_touches: dict[str, float] = {}
+        self.conn = sqlite3.connect(db_file, timeout=60.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)")
+        self.conn.commit()
+
+    def key(self, kind: str, text: str, att_replace_map: dict[str, str]) -> str:
+        h = hashlib.sha256()
+        for x in [self.version, kind, text, json.dumps(att_replace_map, sort_keys=True)]:
+            h.update(x.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, key: str):
+        row = self.conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.pending_touches[key] = time.time()
+        return row[0]
+
+    def put(self, key: str, value: str):
+        size = len(key) + len(value.encode("utf-8"))
+        self.conn.execute("INSERT OR REPLACE INTO cache (key, value, size, last_used) VALUES (?, ?, ?, ?)", (key, value, size, time.time()))
+        self.pending_writes += 1
+        self.unchecked_writes += 1
+        if self.pending_writes >= COMMIT_INTERVAL:
+            self.flush()
+
+    def cached(self, kind: str, text: str, att_replace_map: dict[str, str], convert: Callable[[str, dict[str, str]], str]) -> str:
+        """Return the cached conversion of the text, or convert it and store the result
+        """
+        key = self.key(kind, text, att_replace_map)
+        value = self.get(key)
+        if value is None:
+            value = convert(text, att_replace_map)
+            self.put(key, value)
+        return value
+
+    def flush(self):
+        """Commit pending writes and last-used timestamps, and evict least recently used entries if the cache is over the size cap
+        """
+        if self.pending_touches:
+            self.conn.executemany("UPDATE cache SET last_used = ? WHERE key = ?", [(ts, key) for (key, ts) in self.pending_touches.items()])
+            self.pending_touches = {}
+        if self.unchecked_writes >= EVICT_CHECK_INTERVAL:
+            self.__evict()
+        self.pending_writes = 0
+        self.conn.commit()
+
+    def __evict(self):
+        self.unchecked_writes = 0
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * EVICT_TARGET_RATIO)
+        removed = 0
+        keys = []
+        for (key, size) in self.conn.execute("SELECT key, size FROM cache ORDER BY last_used"):
+            keys.append((key,))
+            removed += size
+            if removed >= target:
+                break
+        self.conn.executemany("DELETE FROM cache WHERE key = ?", keys)
+        self.evicted += len(keys)
+
+    def close(self):
+        self.flush()
+        # the size cap may have been lowered since the last run
+        self.__evict()
+        self.conn.commit()
+        self.conn.close()
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evicted": self.evicted}
@@ -0,0 +1,49 @@
+from pathlib import Path
+import hashlib
+import json
+import os
+
+import json_util
+
+
+MANIFEST_VERSION = 1
+
+
+def input_hash(*values) -> str:
+    """SHA-256 of a canonical JSON encoding of the values (standard json module, sorted keys, ASCII only), so the hash does not depend on the JSON backend
+    """
+    return hashlib.sha256(json.dumps(list(values), sort_keys=True, ensure_ascii=True, separators=(",", ":")).encode("ascii")).hexdigest()
+
+
+class ConvertManifest(object):
+    """Records the hashes of the inputs each GitHub issue data was converted from
+
+    An issue is up to date if its GitHub data exists and none of its inputs changed since it was converted, so re-runs convert only stale issues.
+    Call `save()` to persist the manifest.
+    """
+    def __init__(self, manifest_file: Path):
+        self.manifest_file = manifest_file
+        self.issues: dict[str, dict[str, str]] = {}
+        if manifest_file.exists():
+            o = json_util.load_file(manifest_file)
+            if o.get("version") == MANIFEST_VERSION:
+                self.issues = o.get("issues", {})
+
+    def changed_inputs(self, num: int, inputs: dict[str, str]) -> list[str]:
+        """Names of the inputs that differ from the recorded ones (all inputs if the issue was never converted)
+        """
+        recorded = self.issues.get(str(num))
+        if recorded is None:
+            return list(inputs.keys())
+        return [name for (name, h) in inputs.items() if recorded.get(name) != h]
+
+    def record(self, num: int, inputs: dict[str, str]):
+        self.issues[str(num)] = inputs
+
+    def forget(self, num: int):
+        self.issues.pop(str(num), None)
+
+    def save(self):
+        tmp_file = self.manifest_file.with_name(self.manifest_file.name + ".tmp")
+        json_util.dump_file(tmp_file, {"version": MANIFEST_VERSION, "issues": self.issues})
+        os.replace(tmp_file, self.manifest_file)
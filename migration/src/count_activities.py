@@ -0,0 +1,37 @@
+#
+# Count the issues each Jira user was involved in (as reporter, assignee or commenter); the output is CSV (name,display name,count)
+# Usage:
+#   python src/count_activities.py > activities.csv
+#   python src/count_activities.py --min <min issue number> --max <max issue number>
+#
+
+import argparse
+from pathlib import Path
+from collections import Counter
+import sys
+
+from common import JIRA_DUMP_DIRNAME
+from dump_store import open_jira_dump_store
+from dump_index import open_synced_index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--min', type=int, dest='min', required=False, help='Minimum Jira issue number to be counted')
+    parser.add_argument('--max', type=int, dest='max', required=False, help='Maximum Jira issue number to be counted')
+    args = parser.parse_args()
+
+    dump_dir = Path(__file__).resolve().parent.parent.joinpath(JIRA_DUMP_DIRNAME)
+    if not dump_dir.exists():
+        print(f"Jira dump dir not exists: {dump_dir}", file=sys.stderr)
+        sys.exit(1)
+    # the users of each issue (reporter, assignee and comment authors) are in the dump index
+    index = open_synced_index(dump_dir, open_jira_dump_store(dump_dir))
+
+    counts: Counter = Counter()
+    for (num, entry) in sorted(index.entries().items()):
+        if (args.min is not None and num < args.min) or (args.max is not None and num > args.max):
+            continue
+        counts.update((name, disp_name) for (name, disp_name) in entry["users"])
+    for ((name, disp_name), c) in counts.most_common():
+        print(f"{name},{disp_name},{c}")
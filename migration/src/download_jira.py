@@ -3,83 +3,383 @@
 # Usage:
 #   python src/download_jira.py --issues <issue number list>
 #   python src/download_jira.py --min <min issue number> --max <max issue number>
+#   python src/download_jira.py --min <min issue number> --max <max issue number> --workers <number of workers>
+#   python src/download_jira.py --min <min issue number> --max <max issue number> --bulk
+#   python src/download_jira.py --updated-since <yyyy-MM-dd [HH:mm]>
+#   python src/download_jira.py --refresh
+#   python src/download_jira.py --attachments-only
+#   python src/download_jira.py --min <min issue number> --max <max issue number> --rendered
+#   python src/download_jira.py --min <min issue number> --max <max issue number> --compact-json
 #
 
 import argparse
 from pathlib import Path
-import json
+import os
+import sys
+import threading
 import time
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
 
 import requests
 
-from common import LOG_DIRNAME, JIRA_DUMP_DIRNAME, JIRA_ATTACHMENTS_DIRNAME, logging_setup, jira_dump_file, jira_attachments_dir, jira_issue_id
+from common import LOG_DIRNAME, JIRA_DUMP_DIRNAME, JIRA_ATTACHMENTS_DIRNAME, JIRA_DUMP_MANIFEST_FILENAME, ATTACHMENT_PLAN_FILENAME, logging_setup, jira_attachments_dir, jira_issue_id, RateLimiter
+from dump_store import DumpStore, open_jira_dump_store
+from dump_index import DumpIndex, entry_attachments, open_synced_index
+from attachment_store import AttachmentStore
+from attachment_plan import Attachment, AttachmentPlan, select_attachments
+from http_util import JIRA_API_BASE, RequestStats, jira_request
+from jira_util import JIRA_FIELDS, latest_attachments
+import json_util
 
 log_dir = Path(__file__).resolve().parent.parent.joinpath(LOG_DIRNAME)
 logger = logging_setup(log_dir, "download_jira")
+request_stats = RequestStats()
 
 DOWNLOAD_INTERVAL_SEC = 0.5
+SEARCH_PAGE_SIZE = 100
+# Jira interprets JQL dates in the server (or user) time zone, so look back a bit further than the last sync
+REFRESH_MARGIN = timedelta(days=1)
+ATTACHMENT_CHUNK_SIZE = 1024 * 1024
+RENDERED_FIELDS_EXPAND = "renderedFields"
+# fields always needed by the downloader itself (manifest and attachments)
+DOWNLOADER_FIELDS = ["updated", "attachment"]
+
+ISSUE_DOWNLOADED = "downloaded"
+ISSUE_NOT_FOUND = "not_found"
+ISSUE_FAILED = "failed"
+
+ATTACHMENT_DOWNLOADED = "downloaded"
+ATTACHMENT_SKIPPED = "skipped"
+ATTACHMENT_FAILED = "failed"
+ATTACHMENT_EXCLUDED = "excluded"
 
 
 @dataclass
-class Attachment(object):
-    filename: str
-    created: str
-    content: str
-    mime_type: str
+class DownloadResult(object):
+    num: int
+    status: str
+    attachments: int = 0
+    failed_attachments: int = 0
+    excluded_attachments: int = 0
+
+
+class JiraSearchException(Exception):
+    pass
+
+
+class DownloadManifest(object):
+    """Records the `updated` timestamp of each dumped issue and the attachments downloaded so far
+
+    Updates are thread-safe; call `save()` to persist the manifest.
+    """
+    def __init__(self, manifest_file: Path):
+        self.manifest_file = manifest_file
+        self.lock = threading.Lock()
+        self.issues: dict[str, dict] = {}
+        if manifest_file.exists():
+            self.issues = json_util.load_file(manifest_file).get("issues", {})
+
+    def updated(self, num: int) -> Optional[str]:
+        with self.lock:
+            return self.issues.get(str(num), {}).get("updated")
+
+    def set_updated(self, num: int, updated: str):
+        with self.lock:
+            self.issues.setdefault(str(num), {"attachments": {}})["updated"] = updated
+
+    def has_attachment(self, num: int, attachment_id: str) -> bool:
+        with self.lock:
+            return attachment_id in self.issues.get(str(num), {}).get("attachments", {})
+
+    def add_attachment(self, num: int, attachment_id: str, created: str):
+        with self.lock:
+            self.issues.setdefault(str(num), {"attachments": {}})["attachments"][attachment_id] = created
+
+    def last_updated(self) -> Optional[datetime]:
+        with self.lock:
+            timestamps = [parse_jira_timestamp(x.get("updated")) for x in self.issues.values() if x.get("updated")]
+        return max(timestamps) if timestamps else None
+
+    def save(self):
+        with self.lock:
+            tmp_file = self.manifest_file.with_name(self.manifest_file.name + ".tmp")
+            json_util.dump_file(tmp_file, {"issues": self.issues})
+            os.replace(tmp_file, self.manifest_file)
+
+
+def parse_jira_timestamp(ts: str) -> datetime:
+    # e.g., "2022-06-26T01:57:02.408+0000"
+    return datetime.strptime(ts, "%Y-%m-%dT%H:%M:%S.%f%z")
 
 
 def issue_uri(issue_id: str) -> str:
-    return f"https://issues.apache.org/jira/rest/api/latest/issue/{issue_id}"
+    return f"{JIRA_API_BASE}/rest/api/latest/issue/{issue_id}"
+
+
+def search_uri() -> str:
+    return f"{JIRA_API_BASE}/rest/api/2/search"
+
 
+def jql_key_range(min_num: int, max_num: int) -> str:
+    return f"project = LUCENE AND key >= {jira_issue_id(min_num)} AND key <= {jira_issue_id(max_num)} ORDER BY key ASC"
 
-def download_issue(num: int, dump_dir: Path) -> bool:
+
+def jql_keys(nums: list[int]) -> str:
+    return f"project = LUCENE AND key in ({', '.join(jira_issue_id(num) for num in nums)}) ORDER BY key ASC"
+
+
+def jql_updated_since(ts: str) -> str:
+    return f'project = LUCENE AND updated >= "{ts}" ORDER BY key ASC'
+
+
+def issue_params(fields: list[str], expand: list[str]) -> dict[str, str]:
+    """Query parameters to project the issue payload on the given fields
+    """
+    params = {"fields": ",".join(fields)}
+    if expand:
+        params["expand"] = ",".join(expand)
+    return params
+
+
+def jira_get(url: str, limiter: RateLimiter, category: str, **kwargs) -> requests.Response:
+    """Send a GET request with jira_request(); requests are recorded in `request_stats`
+    """
+    return jira_request("GET", url, limiter, category, request_stats, logger, **kwargs)
+
+
+def download_issue(num: int, dump_store: DumpStore, limiter: RateLimiter, manifest: DownloadManifest, index: DumpIndex, params: dict[str, str]) -> tuple[str, Optional[dict]]:
     issue_id = jira_issue_id(num)
     uri = issue_uri(issue_id)
-    res = requests.get(uri)
+    res = jira_get(uri, limiter, "issue", params=params)
     if res.status_code != 200:
         logger.warning(f"Can't download {issue_id}. status code={res.status_code}, message={res.text}")
+        return (ISSUE_NOT_FOUND if res.status_code == 404 else ISSUE_FAILED, None)
+    o = json_util.loads(res.content)
+    location = write_issue_dump(num, o, dump_store, manifest, index)
+    logger.debug(f"Jira issue {issue_id} was downloaded in {location}.")
+    return (ISSUE_DOWNLOADED, o)
+
+
+def write_issue_dump(num: int, o: dict, dump_store: DumpStore, manifest: DownloadManifest, index: DumpIndex) -> str:
+    location = dump_store.write(num, o)
+    manifest.set_updated(num, o.get("fields", {}).get("updated", ""))
+    index.update(num, o, location, dump_store.size(num))
+    return location
+
+
+def search_issues(jql: str, limiter: RateLimiter, params: dict[str, str]) -> Iterator[dict]:
+    """Iterate all issues matching the JQL; they are fetched page by page via the search API
+
+    The query is not validated, so keys of deleted or moved issues in the JQL are skipped (with a warning) instead of failing the whole search.
+    """
+    start_at = 0
+    while True:
+        page_params = {"jql": jql, "startAt": start_at, "maxResults": SEARCH_PAGE_SIZE, "validateQuery": "false", **params}
+        res = jira_get(search_uri(), limiter, "search", params=page_params)
+        if res.status_code != 200:
+            raise JiraSearchException(f"Failed to search Jira issues. jql={jql}, startAt={start_at}, status code={res.status_code}, message={res.text}")
+        page = json_util.loads(res.content)
+        if start_at == 0:
+            for msg in page.get("warningMessages", []):
+                logger.warning(f"Jira search warning: {msg}")
+        issues = page.get("issues", [])
+        yield from issues
+        # the server may return less issues than requested, so advance by the actual page size
+        start_at += len(issues)
+        if not issues or start_at >= page.get("total", 0):
+            break
+
+
+def issue_number(o: dict) -> int:
+    return int(o.get("key").rsplit("-", maxsplit=1)[1])
+
+
+def download_attachment(num: int, a: Attachment, att_data_dir: Path, limiter: RateLimiter, manifest: DownloadManifest, store: AttachmentStore) -> str:
+    """Download an attached file unless it was already downloaded
+
+    Files that were already downloaded (recorded in the manifest or the attachment store) are skipped since Jira attachments are immutable.
+    Downloaded files are moved into the content-addressed store and linked from the issue's attachments dir.
+    """
+    attachments_dir = jira_attachments_dir(att_data_dir, num)
+    attachments_dir.mkdir(exist_ok=True)
+    attachment_file = attachments_dir.joinpath(a.filename)
+    sha256 = store.lookup(a.id)
+    if sha256:
+        store.link(sha256, attachment_file)
+        manifest.add_attachment(num, a.id, a.created)
+        return ATTACHMENT_SKIPPED
+    if attachment_file.exists() and (manifest.has_attachment(num, a.id) or attachment_file.stat().st_size == a.size):
+        # already complete (downloaded before the store was introduced)
+        store.add(a.id, attachment_file)
+        manifest.add_attachment(num, a.id, a.created)
+        return ATTACHMENT_SKIPPED
+    logger.info(f"Downloading attachment {a.filename}")
+    if not download_attachment_file(a, attachment_file, limiter):
+        logger.error(f"Failed to download attachment {a.filename} in issue {jira_issue_id(num)}")
+        return ATTACHMENT_FAILED
+    store.add(a.id, attachment_file)
+    manifest.add_attachment(num, a.id, a.created)
+    return ATTACHMENT_DOWNLOADED
+
+
+class AttachmentFetcher(object):
+    """Attachment download stage running on its own thread pool
+
+    Attachments can be submitted while issues are still being downloaded. The same content URL is fetched only once.
+    Attachments excluded by the attachment plan (see plan_attachments.py) are not fetched.
+    """
+    def __init__(self, att_data_dir: Path, limiter: RateLimiter, manifest: DownloadManifest, store: AttachmentStore, plan: Optional[AttachmentPlan], max_workers: int):
+        self.att_data_dir = att_data_dir
+        self.limiter = limiter
+        self.manifest = manifest
+        self.store = store
+        self.plan = plan
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="attachment")
+        self.lock = threading.Lock()
+        self.urls: set[str] = set()
+        self.futures: list[tuple[int, Future]] = []
+        self.excluded: Counter = Counter()
+
+    def submit(self, num: int, attachments: list[Attachment]):
+        with self.lock:
+            for a in attachments:
+                if a.content in self.urls:
+                    continue
+                if self.plan and self.plan.is_skipped(num, a.id):
+                    logger.debug(f"Attachment {a.filename} in issue {jira_issue_id(num)} is excluded by the plan")
+                    self.excluded[num] += 1
+                    continue
+                self.urls.add(a.content)
+                self.futures.append((num, self.executor.submit(self.__fetch, num, a)))
+
+    def __fetch(self, num: int, a: Attachment) -> str:
+        try:
+            return download_attachment(num, a, self.att_data_dir, self.limiter, self.manifest, self.store)
+        except Exception as e:
+            logger.error(f"Exception raised during downloading attachment {a.filename} in issue {jira_issue_id(num)}. error={str(e)}")
+            return ATTACHMENT_FAILED
+
+    def wait(self) -> dict[int, Counter]:
+        """Wait for all submitted downloads; returns the counts of download statuses per issue
+        """
+        self.executor.shutdown(wait=True)
+        counts: dict[int, Counter] = defaultdict(Counter)
+        for (num, future) in self.futures:
+            counts[num][future.result()] += 1
+        for (num, cnt) in self.excluded.items():
+            counts[num][ATTACHMENT_EXCLUDED] += cnt
+        return counts
+
+
+def download_attachment_file(a: Attachment, attachment_file: Path, limiter: RateLimiter) -> bool:
+    """Stream the attachment to a partial file and move it to the destination when it is complete
+
+    If a partial file is left by a previous run, the download is resumed with a HTTP Range request.
+    The file size is verified against the size in the Jira attachment metadata. If the metadata has no size (0),
+    the size is unknown: a partial file can't be verified, so it is discarded and the whole file is downloaded.
+    """
+    part_file = attachment_file.with_name(attachment_file.name + ".part")
+    offset = part_file.stat().st_size if part_file.exists() else 0
+    if offset > 0 and (not a.size or offset > a.size):
+        part_file.unlink()
+        offset = 0
+    headers = {"Accept": a.mime_type}
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+
+    nbytes = 0
+    try:
+        with jira_get(a.content, limiter, "attachment", headers=headers, stream=True) as res:
+            # res.elapsed covers the time until the response headers arrived
+            start = time.monotonic() - res.elapsed.total_seconds()
+            if res.status_code == 416 and offset == a.size:
+                # the partial file was already complete
+                pass
+            elif res.status_code in [200, 206]:
+                # the server may ignore the Range header and send the whole content
+                mode = "ab" if res.status_code == 206 else "wb"
+                with open(part_file, mode) as fp:
+                    for chunk in res.iter_content(chunk_size=ATTACHMENT_CHUNK_SIZE):
+                        fp.write(chunk)
+                        nbytes += len(chunk)
+            request_stats.record("attachment", res.status_code, time.monotonic() - start, nbytes)
+            if res.status_code not in [200, 206, 416] or (res.status_code == 416 and offset != a.size):
+                logger.warning(f"Can't download {a.content}. status code={res.status_code}")
+                return False
+    except requests.RequestException as e:
+        # keep the partial file to resume from it next time
+        logger.warning(f"Download of {a.content} was interrupted. error={str(e)}")
         return False
-    dump_file = jira_dump_file(dump_dir, num)
-    with open(dump_file, "w") as fp:
-        json.dump(res.json(), fp, indent=2)
-    logger.debug(f"Jira issue {issue_id} was downloaded in {dump_file}.")
+
+    size = part_file.stat().st_size
+    if a.size and size != a.size:
+        logger.warning(f"Size mismatch for {a.content}. expected={a.size}, actual={size}")
+        if size > a.size:
+            part_file.unlink()
+        return False
+    os.replace(part_file, attachment_file)
     return True
 
 
-def download_attachments(num: int, dump_dir: Path, att_data_dir: Path):
-    dump_file = jira_dump_file(dump_dir, num)
-    assert dump_file.exists()
-    attachments_dir = jira_attachments_dir(att_data_dir, num)
-    if not attachments_dir.exists():
-        attachments_dir.mkdir()
-    
-    files: dict[str, Attachment] = {}
-    with open(dump_file) as fp:
-        o = json.load(fp)
-        attachments = o.get("fields").get("attachment")
-        if not attachments:
-            return
-        for a in attachments:
-            filename = a.get("filename")
-            created = a.get("created")
-            content = a.get("content")
-            mime_type = a.get("mimeType")
-            if not (filename and created and content and mime_type):
-                continue
-            if filename not in files or created > files[filename].created:
-                files[filename] = Attachment(filename=filename, created=created, content=content, mime_type=mime_type)
-
-    for (_, a) in files.items():
-        logger.info(f"Downloading attachment {a.filename}")
-        res = requests.get(a.content, headers={"Accept": a.mime_type})
-        if res.status_code != 200:
-            logger.error(f"Failed to download attachment {a.filename} in issue {jira_issue_id(num)}")
+def download_issue_with_attachments(num: int, dump_store: DumpStore, limiter: RateLimiter, manifest: DownloadManifest, index: DumpIndex, params: dict[str, str], fetcher: AttachmentFetcher) -> DownloadResult:
+    try:
+        (status, o) = download_issue(num, dump_store, limiter, manifest, index, params)
+        if o:
+            fetcher.submit(num, select_attachments(o))
+        return DownloadResult(num=num, status=status)
+    except Exception as e:
+        logger.error(f"Exception raised during downloading {jira_issue_id(num)}. error={str(e)}")
+        return DownloadResult(num=num, status=ISSUE_FAILED)
+
+
+def collect_attachments(nums: list[int], index: DumpIndex) -> list[tuple[int, list[Attachment]]]:
+    """Make the attachment work list of existing dumps from the dump index
+    """
+    res = []
+    for num in nums:
+        entry = index.get(num)
+        if not entry:
             continue
-        attachment_file = attachments_dir.joinpath(a.filename)
-        with open(attachment_file, "wb") as fp:
-            fp.write(res.content)
-        time.sleep(DOWNLOAD_INTERVAL_SEC)
+        res.append((num, [a for (a, _) in latest_attachments(entry_attachments(entry))]))
+    return res
+
+
+def merge_attachment_counts(results: list[DownloadResult], counts: dict[int, Counter]):
+    for r in results:
+        r.attachments = counts[r.num][ATTACHMENT_DOWNLOADED]
+        r.failed_attachments = counts[r.num][ATTACHMENT_FAILED]
+        r.excluded_attachments = counts[r.num][ATTACHMENT_EXCLUDED]
+
+
+def write_run_report(results: list[DownloadResult], report_file: Path):
+    """Log request statistics and write them with the issue outcomes to a machine-readable report
+    """
+    summary = request_stats.summary()
+    for (category, x) in summary["requests"].items():
+        latency = x["latency_sec"]
+        logger.info(f"{category}: requests={x['count']}, latency p50={latency['p50']}s p95={latency['p95']}s p99={latency['p99']}s max={latency['max']}s, "
+                    f"bytes={x['bytes']}, throughput={x['requests_per_sec']} req/s {x['bytes_per_sec']} bytes/s, status codes={x['status_codes']}")
+    for (category, sec) in summary["waits_sec"].items():
+        logger.info(f"{category}: waited {sec} sec in total")
+    summary["issues"] = Counter(r.status for r in results)
+    summary["attachments"] = {ATTACHMENT_DOWNLOADED: sum(r.attachments for r in results), ATTACHMENT_FAILED: sum(r.failed_attachments for r in results), ATTACHMENT_EXCLUDED: sum(r.excluded_attachments for r in results)}
+    json_util.dump_file(report_file, summary, pretty=True)
+    logger.info(f"Run report was written in {report_file}")
+
+
+def report_results(results: list[DownloadResult]):
+    for r in results:
+        logger.debug(f"{jira_issue_id(r.num)}: {r.status}, attachments={r.attachments}, failed attachments={r.failed_attachments}")
+    counts = Counter(r.status for r in results)
+    logger.info(f"Issues: downloaded={counts[ISSUE_DOWNLOADED]}, not found={counts[ISSUE_NOT_FOUND]}, failed={counts[ISSUE_FAILED]}")
+    logger.info(f"Attachments: downloaded={sum(r.attachments for r in results)}, failed={sum(r.failed_attachments for r in results)}, excluded={sum(r.excluded_attachments for r in results)}")
+    failed_issues = [jira_issue_id(r.num) for r in results if r.status == ISSUE_FAILED or r.failed_attachments > 0]
+    if failed_issues:
+        logger.info(f"Issues that need to be retried: {' '.join(failed_issues)}")
 
 
 if __name__ == "__main__":
@@ -87,12 +387,28 @@ if __name__ == "__main__":
     parser.add_argument('--issues', type=int, required=False, nargs='*', help='Jira issue number list to be downloaded')    
     parser.add_argument('--min', type=int, dest='min', required=False, default=1, help='Minimum Jira issue number to be donloaded')
     parser.add_argument('--max', type=int, dest='max', required=False, help='Maximum Jira issue number to be donloaded')
+    parser.add_argument('--bulk', action='store_true', help='Download issues in pages via the search API instead of one request per issue')
+    parser.add_argument('--updated-since', type=str, dest='updated_since', required=False, help='Download issues updated since the given time ("yyyy-MM-dd" or "yyyy-MM-dd HH:mm") via the search API')
+    parser.add_argument('--refresh', action='store_true', help='Download only issues updated since the last download and attachments that are new')
+    parser.add_argument('--attachments-only', action='store_true', help='Download attachments of already downloaded issues (all dumped issues if no issue number is given)')
+    parser.add_argument('--fields', type=str, dest='fields', required=False, help='Comma separated Jira fields to be downloaded (default: the fields used by the converter)')
+    parser.add_argument('--all-fields', action='store_true', help='Download all Jira fields')
+    parser.add_argument('--expand', type=str, dest='expand', required=False, help='Comma separated Jira expand parameters (e.g. "renderedFields")')
+    parser.add_argument('--rendered', action='store_true', help='Also download the HTML rendered by Jira (same as "--expand renderedFields"), used by "jira2github_import.py --engine html"')
+    parser.add_argument('--sharded', action='store_true', help='Store dumps in compressed shards instead of one JSON file per issue')
+    parser.add_argument('--compact-json', action='store_true', help='Write dump files without indentation (smaller and faster to write; shards are always compact)')
+    parser.add_argument('--workers', type=int, dest='workers', required=False, default=1, help='Number of concurrent download workers')
+    parser.add_argument('--attachment-workers', type=int, dest='attachment_workers', required=False, default=1, help='Number of concurrent attachment download workers')
+    parser.add_argument('--ignore-plan', action='store_true', help='Download all attachments even if they are excluded by the attachment plan')
+    parser.add_argument('--rate', type=float, dest='rate', required=False, default=1 / DOWNLOAD_INTERVAL_SEC, help='Maximum number of requests per second sent to Jira')
     args = parser.parse_args()
 
     dump_dir = Path(__file__).resolve().parent.parent.joinpath(JIRA_DUMP_DIRNAME)
     if not dump_dir.exists():
         dump_dir.mkdir()
     assert dump_dir.exists()
+    dump_store = open_jira_dump_store(dump_dir, True if args.sharded else None, not args.compact_json)
+    index = open_synced_index(dump_dir, dump_store)
 
     att_data_dir = Path(__file__).resolve().parent.parent.joinpath(JIRA_ATTACHMENTS_DIRNAME)
     if not att_data_dir.exists():
@@ -102,18 +418,90 @@ if __name__ == "__main__":
     issues = []
     if args.issues:
         issues = args.issues
+    elif args.attachments_only and not args.max:
+        issues = index.numbers()
     else:
         if args.max:
             issues.extend(list(range(args.min, args.max + 1)))
         else:
             issues.append(args.min)
     
-    logger.info(f"Downloading Jira issues in {dump_dir}")
-    for num in issues:
-        download_issue(num, dump_dir)
-        download_attachments(num, dump_dir, att_data_dir)
-        time.sleep(DOWNLOAD_INTERVAL_SEC)
-    
+    if args.all_fields:
+        fields = ["*all"]
+    elif args.fields:
+        fields = sorted(set(args.fields.split(",")) | set(DOWNLOADER_FIELDS))
+    else:
+        fields = sorted(JIRA_FIELDS | set(DOWNLOADER_FIELDS))
+    expand = args.expand.split(",") if args.expand else []
+    if args.rendered and RENDERED_FIELDS_EXPAND not in expand:
+        expand.append(RENDERED_FIELDS_EXPAND)
+    params = issue_params(fields, expand)
+
+    limiter = RateLimiter(args.rate)
+    manifest = DownloadManifest(dump_dir.joinpath(JIRA_DUMP_MANIFEST_FILENAME))
+
+    if args.refresh:
+        last_updated = manifest.last_updated()
+        if not last_updated:
+            logger.error("No downloaded issues are recorded in the manifest. Please run a full download first.")
+            sys.exit(1)
+        since = (last_updated - REFRESH_MARGIN).strftime("%Y-%m-%d %H:%M")
+        jqls = [jql_updated_since(since)]
+    elif args.updated_since:
+        jqls = [jql_updated_since(args.updated_since)]
+    elif args.bulk and args.issues:
+        jqls = [jql_keys(issues[i:i + SEARCH_PAGE_SIZE]) for i in range(0, len(issues), SEARCH_PAGE_SIZE)]
+    elif args.bulk:
+        jqls = [jql_key_range(min(issues), max(issues))]
+    else:
+        jqls = []
+
+    store = AttachmentStore(att_data_dir)
+    plan_file = dump_dir.joinpath(ATTACHMENT_PLAN_FILENAME)
+    plan = AttachmentPlan(plan_file) if plan_file.exists() and not args.ignore_plan else None
+    fetcher = AttachmentFetcher(att_data_dir, limiter, manifest, store, plan, args.attachment_workers)
+
+    logger.info(f"Downloading Jira issues in {dump_dir} (workers={args.workers}, attachment workers={args.attachment_workers}, rate={args.rate}/sec)")
+    try:
+        if args.attachments_only:
+            work_list = collect_attachments(issues, index)
+            for (num, attachments) in work_list:
+                fetcher.submit(num, attachments)
+            results = [DownloadResult(num=num, status=ISSUE_DOWNLOADED) for (num, _) in work_list]
+        elif jqls:
+            found = []
+            for jql in jqls:
+                for o in search_issues(jql, limiter, params):
+                    num = issue_number(o)
+                    if args.refresh and manifest.updated(num) == o.get("fields", {}).get("updated"):
+                        # not changed since the last download
+                        continue
+                    location = write_issue_dump(num, o, dump_store, manifest, index)
+                    logger.debug(f"Jira issue {jira_issue_id(num)} was downloaded in {location}.")
+                    fetcher.submit(num, select_attachments(o))
+                    found.append(num)
+            results = [DownloadResult(num=num, status=ISSUE_DOWNLOADED) for num in found]
+            if args.bulk and not (args.refresh or args.updated_since):
+                results.extend(DownloadResult(num=num, status=ISSUE_NOT_FOUND) for num in sorted(set(issues) - set(found)))
+        else:
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                results = list(executor.map(lambda num: download_issue_with_attachments(num, dump_store, limiter, manifest, index, params, fetcher), issues))
+        merge_attachment_counts(results, fetcher.wait())
+    except JiraSearchException as e:
+        logger.error(str(e))
+        logger.error("Bulk download was aborted.")
+        fetcher.wait()
+        sys.exit(1)
+    finally:
+        # the dumps are synced before the manifest and the index refer to them
+        dump_store.close()
+        manifest.save()
+        index.save()
+        store.save()
+    report_results(results)
+    logger.info(f"Attachment store: {store.stats()}")
+    write_run_report(results, log_dir.joinpath(f"download_jira_report_{datetime.now().isoformat(timespec='seconds')}.json"))
+
     logger.info("Done.")
     
 
@@ -0,0 +1,200 @@
+#
+# Index of Jira dumps for corpus-wide queries without loading every dump
+# Usage:
+#   python src/dump_index.py --rebuild
+#   python src/dump_index.py --largest 20 --by size
+#   python src/dump_index.py --issues <issue number list>
+#
+
+import argparse
+from pathlib import Path
+from typing import Optional
+import json
+import os
+import sys
+import threading
+
+from common import JIRA_DUMP_DIRNAME, JIRA_DUMP_INDEX_FILENAME, jira_issue_id
+from dump_store import DumpStore, open_jira_dump_store
+from jira_util import Attachment, JiraIssue, parse_issue
+import json_util
+
+
+INDEX_VERSION = 2
+SORT_KEYS = ["size", "comments", "attachments", "attachment_size", "text_size"]
+
+
+def index_entry(o: dict, location: str, size: int) -> dict:
+    """Summary of a Jira dump stored in the index
+    """
+    issue = parse_issue(o)
+    (text_sizes, html_sizes) = issue_text_sizes(issue)
+    return {
+        "location": location,
+        "size": size,
+        "updated": issue.updated,
+        "status": issue.status,
+        "comments": issue.comment_total,
+        "attachments": [{"id": a.id, "filename": a.filename, "created": a.created, "content": a.content, "mime_type": a.mime_type, "size": a.size} for a in issue.attachments],
+        "attachment_size": sum(a.size for a in issue.attachments),
+        "links": issue.issue_links,
+        "subtasks": issue.subtasks,
+        "users": sorted([name, dispname] for (name, dispname) in issue_users(issue)),
+        "text_sizes": text_sizes,
+        "html_sizes": html_sizes,
+        "text_size": sum(text_sizes),
+    }
+
+
+def issue_users(issue: JiraIssue) -> set[tuple[str, str]]:
+    """(name, display name) of the reporter, assignee and comment authors
+    """
+    users = {issue.reporter, issue.assignee}
+    users.update((c.author_name, c.author_dispname) for c in issue.comments)
+    return users
+
+
+def issue_text_sizes(issue: JiraIssue) -> tuple[list[int], Optional[list[Optional[int]]]]:
+    """Sizes in characters of the description and each comment in Jira markup, and in rendered HTML (None if the issue has no rendered fields)
+
+    The HTML size of a text is None if the converter falls back to Jira markup for it (see jira2github_import.issue_texts()).
+    """
+    text_sizes = [len(issue.description.strip())] + [len(c.body) for c in issue.comments]
+    if issue.rendered_description is None:
+        return (text_sizes, None)
+    html_sizes: list[Optional[int]] = [len(issue.rendered_description)]
+    if issue.rendered_comments is not None and len(issue.rendered_comments) == len(issue.comments):
+        html_sizes.extend(len(c) for c in issue.rendered_comments)
+    else:
+        html_sizes.extend(None for _ in issue.comments)
+    return (text_sizes, html_sizes)
+
+
+def entry_attachments(entry: dict) -> list[Attachment]:
+    """All versions of all attached files of an indexed issue
+    """
+    return [Attachment(**a) for a in entry["attachments"]]
+
+
+class DumpIndex(object):
+    """Maps each dumped issue number to its location, size, updated timestamp, status, comment count, attachments and linked issues
+
+    The downloader keeps the index up to date; `sync()` catches up with dumps written by other means. Updates are thread-safe, call `save()` to persist the index.
+    """
+    def __init__(self, index_file: Path):
+        self.index_file = index_file
+        self.lock = threading.Lock()
+        self.issues: dict[str, dict] = {}
+        if index_file.exists():
+            o = json_util.load_file(index_file)
+            if o.get("version") == INDEX_VERSION:
+                self.issues = o.get("issues", {})
+
+    def get(self, num: int) -> Optional[dict]:
+        with self.lock:
+            return self.issues.get(str(num))
+
+    def update(self, num: int, o: dict, location: str, size: int):
+        entry = index_entry(o, location, size)
+        with self.lock:
+            self.issues[str(num)] = entry
+
+    def numbers(self) -> list[int]:
+        with self.lock:
+            return sorted(int(k) for k in self.issues.keys())
+
+    def entries(self) -> dict[int, dict]:
+        with self.lock:
+            return {int(k): v for k, v in self.issues.items()}
+
+    def clear(self):
+        with self.lock:
+            self.issues = {}
+
+    def sync(self, dump_store: DumpStore) -> int:
+        """Index the dumps whose location or size differs from the index and drop entries of removed dumps; returns the number of changed entries
+
+        Only the changed dumps are read, so this is cheap if the index is up to date.
+        """
+        nums = dump_store.numbers()
+        with self.lock:
+            removed = self.issues.keys() - set(str(num) for num in nums)
+            for key in removed:
+                del self.issues[key]
+        changed = len(removed)
+        for num in nums:
+            entry = self.get(num)
+            (location, size) = (dump_store.location(num), dump_store.size(num))
+            if entry and entry["location"] == location and entry["size"] == size:
+                continue
+            o = dump_store.read(num)
+            if o:
+                self.update(num, o, location, size)
+                changed += 1
+        return changed
+
+    def save(self):
+        with self.lock:
+            tmp_file = self.index_file.with_name(self.index_file.name + ".tmp")
+            json_util.dump_file(tmp_file, {"version": INDEX_VERSION, "issues": self.issues})
+            os.replace(tmp_file, self.index_file)
+
+
+def open_dump_index(dump_dir: Path) -> DumpIndex:
+    return DumpIndex(dump_dir.joinpath(JIRA_DUMP_INDEX_FILENAME))
+
+
+def open_synced_index(dump_dir: Path, dump_store: DumpStore) -> DumpIndex:
+    """Open the index and bring it up to date with the dumps in the store
+    """
+    index = open_dump_index(dump_dir)
+    if index.sync(dump_store):
+        index.save()
+    return index
+
+
+def rebuild_index(dump_store: DumpStore, index: DumpIndex):
+    """Re-create the index from all dumps in the store
+    """
+    index.clear()
+    index.sync(dump_store)
+
+
+def largest_issues(index: DumpIndex, n: int, by: str = "size") -> list[tuple[int, dict]]:
+    def sort_key(item: tuple[int, dict]):
+        v = item[1].get(by, 0)
+        return len(v) if isinstance(v, list) else v
+    return sorted(index.entries().items(), key=sort_key, reverse=True)[:n]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index from all Jira dumps')
+    parser.add_argument('--largest', type=int, dest='largest', required=False, help='Show the N largest issues')
+    parser.add_argument('--by', type=str, dest='by', required=False, default='size', choices=SORT_KEYS, help='Sort key for --largest')
+    parser.add_argument('--issues', type=int, required=False, nargs='*', help='Jira issue number list to be shown')
+    args = parser.parse_args()
+
+    dump_dir = Path(__file__).resolve().parent.parent.joinpath(JIRA_DUMP_DIRNAME)
+    if not dump_dir.exists():
+        print(f"Jira dump dir not exists: {dump_dir}")
+        sys.exit(1)
+    dump_store = open_jira_dump_store(dump_dir)
+
+    if args.rebuild:
+        index = open_dump_index(dump_dir)
+        rebuild_index(dump_store, index)
+        index.save()
+        print(f"Indexed {len(index.numbers())} issues in {index.index_file}")
+    else:
+        # queries see the dumps written since the index was saved
+        index = open_synced_index(dump_dir, dump_store)
+
+    if args.largest:
+        for (num, entry) in largest_issues(index, args.largest, args.by):
+            print(f"{jira_issue_id(num)}\tsize={entry['size']}\tcomments={entry['comments']}\tattachments={len(entry['attachments'])}\tattachment_size={entry['attachment_size']}\ttext_size={entry['text_size']}")
+
+    if args.issues:
+        for num in args.issues:
+            entry = index.get(num)
+            print(f"{jira_issue_id(num)}\t{json.dumps(entry) if entry else 'not indexed'}")
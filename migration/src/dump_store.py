@@ -0,0 +1,306 @@
+#
+# Storage backends for Jira dumps and GitHub import data
+# Usage (convert an existing data directory to another layout):
+#   python src/dump_store.py --dir jira-dump --to sharded
+#   python src/dump_store.py --dir github-import-data --to files
+#   python src/dump_store.py --dir jira-dump --to files --compact-json
+#
+
+from abc import ABC, abstractmethod
+import argparse
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+import gzip
+import os
+import re
+import threading
+
+# file locks for concurrent writers in several processes (POSIX only)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from common import JIRA_DUMP_DIRNAME, GITHUB_IMPORT_DATA_DIRNAME, jira_dump_file, github_data_file
+import json_util
+
+
+SHARD_SIZE = 1000
+SHARD_SUFFIX = ".jsonl.gz"
+SHARD_INDEX_SUFFIX = ".idx"
+SHARD_INFIX = "-shard-"
+# written records are synced to disk (fsync) after this many writes and on close()
+SYNC_INTERVAL = 100
+
+JIRA_DUMP_PREFIX = "LUCENE"
+GITHUB_DATA_PREFIX = "GH-LUCENE"
+
+
+class DumpStore(ABC):
+    """Key-value store of JSON objects keyed by Jira issue number
+    """
+    @abstractmethod
+    def exists(self, num: int) -> bool:
+        pass
+
+    @abstractmethod
+    def read(self, num: int) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def write(self, num: int, o: dict) -> str:
+        """Store the object; returns its location (for logging)
+        """
+        pass
+
+    @abstractmethod
+    def numbers(self) -> list[int]:
+        pass
+
+    @abstractmethod
+    def location(self, num: int) -> str:
+        pass
+
+    @abstractmethod
+    def size(self, num: int) -> int:
+        """Stored size of the object in bytes (0 if not exists)
+        """
+        pass
+
+    def close(self):
+        """Sync written objects to disk and release open files; the store can still be used afterwards
+        """
+        pass
+
+
+class FileDumpStore(DumpStore):
+    """One JSON file per issue (e.g., jira-dump/LUCENE-1234.json), pretty-printed unless `pretty` is False
+    """
+    def __init__(self, data_dir: Path, file_func: Callable[[Path, int], Path], prefix: str, pretty: bool = True):
+        self.data_dir = data_dir
+        self.file_func = file_func
+        self.pretty = pretty
+        self.regex_file = re.compile(rf"^{re.escape(prefix)}-(\d+)\.json$")
+
+    def exists(self, num: int) -> bool:
+        return self.file_func(self.data_dir, num).exists()
+
+    def read(self, num: int) -> Optional[dict]:
+        data_file = self.file_func(self.data_dir, num)
+        if not data_file.exists():
+            return None
+        return json_util.load_file(data_file)
+
+    def write(self, num: int, o: dict) -> str:
+        data_file = self.file_func(self.data_dir, num)
+        json_util.dump_file(data_file, o, self.pretty)
+        return str(data_file)
+
+    def numbers(self) -> list[int]:
+        nums = []
+        for child in self.data_dir.iterdir():
+            m = self.regex_file.match(child.name)
+            if m:
+                nums.append(int(m.group(1)))
+        return sorted(nums)
+
+    def location(self, num: int) -> str:
+        return str(self.file_func(self.data_dir, num))
+
+    def size(self, num: int) -> int:
+        data_file = self.file_func(self.data_dir, num)
+        return data_file.stat().st_size if data_file.exists() else 0
+
+
+class ShardedDumpStore(DumpStore):
+    """Compressed JSON-lines shards holding SHARD_SIZE issues each (e.g., jira-dump/LUCENE-shard-00001.jsonl.gz), with an offset index per shard
+
+    Each record is written as an independent gzip member, so a shard is a valid gzip file (`zcat` yields JSON lines)
+    and any record can be read by seeking to its offset. The index (`<shard>.idx`) has one "<number> <offset> <length>" line
+    per write; the last line for a number wins, so overwriting a record appends to the shard.
+    Run `python src/dump_store.py --to sharded` on the directory to compact it.
+
+    The shard and index files are kept open. A record is handed to the OS before it is indexed, so a crash of the process leaves
+    at most unindexed bytes in the shard (dropped by compaction), never an index entry without data. Written records are synced
+    to disk every SYNC_INTERVAL writes and on `close()`; after a power failure, a line cut off in the index and index entries
+    beyond the end of the shard are ignored. Writes are serialized by an exclusive lock on the index file (`fcntl.flock`),
+    so several processes can write to the same directory; each instance reads an index once, so it does not see records
+    written by other processes after that. Without `fcntl` (Windows), only one process may write to a directory at a time.
+    """
+    def __init__(self, data_dir: Path, prefix: str):
+        self.data_dir = data_dir
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.indexes: dict[int, dict[int, tuple[int, int]]] = {}
+        # open (shard, index) files of the shards written by this instance
+        self.files: dict[int, tuple[BinaryIO, BinaryIO]] = {}
+        self.unsynced = 0
+
+    def shard_file(self, shard: int) -> Path:
+        return self.data_dir.joinpath(f"{self.prefix}{SHARD_INFIX}{shard:05d}{SHARD_SUFFIX}")
+
+    def index_file(self, shard: int) -> Path:
+        return self.data_dir.joinpath(f"{self.prefix}{SHARD_INFIX}{shard:05d}{SHARD_SUFFIX}{SHARD_INDEX_SUFFIX}")
+
+    def __index(self, shard: int) -> dict[int, tuple[int, int]]:
+        # caller must hold the lock
+        if shard not in self.indexes:
+            index = {}
+            index_file = self.index_file(shard)
+            if index_file.exists():
+                shard_file = self.shard_file(shard)
+                shard_size = shard_file.stat().st_size if shard_file.exists() else 0
+                with open(index_file) as fp:
+                    for line in fp:
+                        cols = line.split()
+                        # skip a line cut off by a crash
+                        if len(cols) != 3 or not line.endswith("\n"):
+                            continue
+                        (offset, length) = (int(cols[1]), int(cols[2]))
+                        # skip a record whose data did not reach the disk before a power failure
+                        if offset + length > shard_size:
+                            continue
+                        index[int(cols[0])] = (offset, length)
+            self.indexes[shard] = index
+        return self.indexes[shard]
+
+    def exists(self, num: int) -> bool:
+        with self.lock:
+            return num in self.__index(num // SHARD_SIZE)
+
+    def read(self, num: int) -> Optional[dict]:
+        shard = num // SHARD_SIZE
+        with self.lock:
+            entry = self.__index(shard).get(num)
+        if not entry:
+            return None
+        (offset, length) = entry
+        with open(self.shard_file(shard), "rb") as fp:
+            fp.seek(offset)
+            return json_util.loads(gzip.decompress(fp.read(length)))
+
+    def write(self, num: int, o: dict) -> str:
+        shard = num // SHARD_SIZE
+        data = gzip.compress(json_util.dumps(o) + b"\n")
+        with self.lock:
+            index = self.__index(shard)
+            if shard not in self.files:
+                self.files[shard] = (open(self.shard_file(shard), "ab"), open(self.index_file(shard), "a+b"))
+            (fp, index_fp) = self.files[shard]
+            if fcntl:
+                fcntl.flock(index_fp.fileno(), fcntl.LOCK_EX)
+            try:
+                offset = fp.seek(0, os.SEEK_END)
+                fp.write(data)
+                fp.flush()
+                index_size = index_fp.seek(0, os.SEEK_END)
+                if index_size > 0:
+                    index_fp.seek(index_size - 1)
+                    if index_fp.read(1) != b"\n":
+                        # terminate a line cut off by a crash; it is skipped when the index is read
+                        index_fp.write(b"\n")
+                index_fp.write(f"{num} {offset} {len(data)}\n".encode("utf-8"))
+                index_fp.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(index_fp.fileno(), fcntl.LOCK_UN)
+            index[num] = (offset, len(data))
+            self.unsynced += 1
+            if self.unsynced >= SYNC_INTERVAL:
+                self.__sync()
+        return f"{self.shard_file(shard)}@{offset}"
+
+    def __sync(self):
+        # caller must hold the lock; shards first, so that synced index entries have their data on disk
+        for (fp, _) in self.files.values():
+            os.fsync(fp.fileno())
+        for (_, index_fp) in self.files.values():
+            os.fsync(index_fp.fileno())
+        self.unsynced = 0
+
+    def close(self):
+        with self.lock:
+            self.__sync()
+            for (fp, index_fp) in self.files.values():
+                fp.close()
+                index_fp.close()
+            self.files = {}
+
+    def numbers(self) -> list[int]:
+        nums = []
+        with self.lock:
+            for index_file in self.data_dir.glob(f"{self.prefix}{SHARD_INFIX}*{SHARD_SUFFIX}{SHARD_INDEX_SUFFIX}"):
+                shard = int(index_file.name[len(self.prefix) + len(SHARD_INFIX):].split(".", maxsplit=1)[0])
+                nums.extend(self.__index(shard).keys())
+        return sorted(nums)
+
+    def location(self, num: int) -> str:
+        shard = num // SHARD_SIZE
+        with self.lock:
+            entry = self.__index(shard).get(num)
+        return f"{self.shard_file(shard)}@{entry[0]}" if entry else ""
+
+    def size(self, num: int) -> int:
+        # compressed size
+        with self.lock:
+            entry = self.__index(num // SHARD_SIZE).get(num)
+        return entry[1] if entry else 0
+
+
+def is_sharded(data_dir: Path, prefix: str) -> bool:
+    return any(data_dir.glob(f"{prefix}{SHARD_INFIX}*{SHARD_SUFFIX}{SHARD_INDEX_SUFFIX}"))
+
+
+def open_store(data_dir: Path, prefix: str, file_func: Callable[[Path, int], Path], sharded: Optional[bool] = None, pretty: bool = True) -> DumpStore:
+    """Open the store in the directory; the layout is detected from existing data unless `sharded` is specified
+
+    `pretty` applies to JSON files written in the one-file-per-issue layout; shards are always compact.
+    """
+    if sharded is None:
+        sharded = is_sharded(data_dir, prefix)
+    return ShardedDumpStore(data_dir, prefix) if sharded else FileDumpStore(data_dir, file_func, prefix, pretty)
+
+
+def open_jira_dump_store(dump_dir: Path, sharded: Optional[bool] = None, pretty: bool = True) -> DumpStore:
+    return open_store(dump_dir, JIRA_DUMP_PREFIX, jira_dump_file, sharded, pretty)
+
+
+def open_github_data_store(data_dir: Path, sharded: Optional[bool] = None, pretty: bool = True) -> DumpStore:
+    return open_store(data_dir, GITHUB_DATA_PREFIX, github_data_file, sharded, pretty)
+
+
+def convert_store(data_dir: Path, prefix: str, file_func: Callable[[Path, int], Path], to_sharded: bool, pretty: bool = True):
+    """Rewrite all data in the directory in the other layout (or compact the shards) and remove the old data
+    """
+    src = open_store(data_dir, prefix, file_func)
+    tmp_dir = data_dir.joinpath(".convert")
+    tmp_dir.mkdir(exist_ok=True)
+    dst = open_store(tmp_dir, prefix, file_func, to_sharded, pretty)
+    nums = src.numbers()
+    for num in nums:
+        dst.write(num, src.read(num))
+    dst.close()
+    if isinstance(src, ShardedDumpStore):
+        old_files = [f for f in data_dir.glob(f"{prefix}{SHARD_INFIX}*{SHARD_SUFFIX}*")]
+    else:
+        old_files = [file_func(data_dir, num) for num in nums]
+    for f in old_files:
+        f.unlink()
+    for f in tmp_dir.iterdir():
+        os.replace(f, data_dir.joinpath(f.name))
+    tmp_dir.rmdir()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dir', type=str, dest='dir', required=True, help=f'Data directory to be converted ("{JIRA_DUMP_DIRNAME}" or "{GITHUB_IMPORT_DATA_DIRNAME}")')
+    parser.add_argument('--to', type=str, dest='to', required=True, choices=['files', 'sharded'], help='Target layout')
+    parser.add_argument('--compact-json', action='store_true', help='Write JSON files without indentation (with "--to files")')
+    args = parser.parse_args()
+
+    data_dir = Path(__file__).resolve().parent.parent.joinpath(args.dir)
+    if Path(args.dir).name == GITHUB_IMPORT_DATA_DIRNAME:
+        convert_store(data_dir, GITHUB_DATA_PREFIX, github_data_file, args.to == "sharded", not args.compact_json)
+    else:
+        convert_store(data_dir, JIRA_DUMP_PREFIX, jira_dump_file, args.to == "sharded", not args.compact_json)
+    print("Done.")
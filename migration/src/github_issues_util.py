@@ -2,11 +2,15 @@ from dataclasses import dataclass, field
 from typing import Any, Optional
 import time
 from logging import Logger
-import requests
+
+from http_util import GITHUB_API_BASE, github_client
+import json_util
 
 
-GITHUB_API_BASE = "https://api.github.com"
 INTERVAL = 2
+IMPORT_API_ACCEPT = "application/vnd.github.golden-comet-preview+json"
+# request bodies are encoded with json_util instead of `json=` of requests
+JSON_CONTENT_TYPE = {"Content-Type": "application/json"}
 
 
 @dataclass
@@ -17,15 +21,13 @@ class GHIssueComment:
 
 def check_authentication(token: str):
     check_url = GITHUB_API_BASE + "/user"
-    headers = {"Authorization": f"token {token}"}
-    res = requests.get(check_url, headers=headers)
+    res = github_client(token).get(check_url)
     assert res.status_code == 200, f"Authentication failed. Please check your GitHub token. status_code={res.status_code}, message={res.text}"
 
 
 def get_issue_body(token: str, repo: str, issue_number: int, logger: Logger) -> Optional[str]:
     url = GITHUB_API_BASE + f"/repos/{repo}/issues/{issue_number}"
-    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"}
-    res = requests.get(url, headers=headers)
+    res = github_client(token).get(url)
     if res.status_code != 200:
         logger.error(f"Failed to get issue {issue_number}; status_code={res.status_code}, message={res.text}")
         return None
@@ -35,9 +37,8 @@ def get_issue_body(token: str, repo: str, issue_number: int, logger: Logger) ->
 
 def update_issue_body(token: str, repo: str, issue_number: int, body: str, logger: Logger) -> bool:
     url = GITHUB_API_BASE + f"/repos/{repo}/issues/{issue_number}"
-    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"}
     data = {"body": body}
-    res = requests.patch(url, headers=headers, json=data)
+    res = github_client(token).patch(url, headers=JSON_CONTENT_TYPE, data=json_util.dumps(data))
     if res.status_code != 200:
         logger.error(f"Failed to update issue {issue_number}; status_code={res.status_code}, message={res.text}")
         return False
@@ -47,13 +48,12 @@ def update_issue_body(token: str, repo: str, issue_number: int, body: str, logge
 
 def get_issue_comments(token: str, repo: str, issue_number: int, logger: Logger) -> list[GHIssueComment]:
     url = GITHUB_API_BASE + f"/repos/{repo}/issues/{issue_number}/comments?per_page=100"
-    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"}
     li = []
     stop = False
     page = 1
     while not stop:
         url_with_paging = url + f"&page={page}"
-        res = requests.get(url_with_paging, headers=headers)
+        res = github_client(token).get(url_with_paging)
         if res.status_code != 200:
             logger.error(f"Failed to get issue comments for {issue_number}; status_code={res.status_code}, message={res.text}")
             break
@@ -68,9 +68,8 @@ def get_issue_comments(token: str, repo: str, issue_number: int, logger: Logger)
 
 def update_comment_body(token: str, repo: str, comment_id: int, body: str, logger: Logger) -> bool:
     url = GITHUB_API_BASE + f"/repos/{repo}/issues/comments/{comment_id}"
-    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"}
     data = {"body": body}
-    res = requests.patch(url, headers=headers, json=data)
+    res = github_client(token).patch(url, headers=JSON_CONTENT_TYPE, data=json_util.dumps(data))
     if res.status_code != 200:
         logger.error(f"Failed to update comment {comment_id}; status_code={res.status_code}, message={res.text}")
         return False
@@ -80,8 +79,8 @@ def update_comment_body(token: str, repo: str, comment_id: int, body: str, logge
 
 def import_issue(token: str, repo: str, issue_data: dict, logger: Logger) -> str:
     url = GITHUB_API_BASE + f"/repos/{repo}/import/issues"
-    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.golden-comet-preview+json"}
-    res = requests.post(url, headers=headers, json=issue_data)
+    headers = {"Accept": IMPORT_API_ACCEPT, **JSON_CONTENT_TYPE}
+    res = github_client(token).post(url, headers=headers, data=json_util.dumps(issue_data))
     if res.status_code != 202:
         logger.error(f"Failed to import issue {issue_data['issue']['title']}; status_code={res.status_code}, message={res.text}")
     time.sleep(INTERVAL)
@@ -89,8 +88,8 @@ def import_issue(token: str, repo: str, issue_data: dict, logger: Logger) -> str
 
 
 def get_import_status(token: str, url: str, logger: Logger) -> Optional[tuple[str, str, list[Any]]]:
-    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.golden-comet-preview+json"}
-    res = requests.get(url, headers=headers)
+    headers = {"Accept": IMPORT_API_ACCEPT}
+    res = github_client(token).get(url, headers=headers)
     if res.status_code != 200:
         logger.error(f"Failed to get import status for {url}; status code={res.status_code}, message={res.text}")
         return None
@@ -0,0 +1,286 @@
+import re
+from html.parser import HTMLParser
+from typing import Optional
+from urllib.parse import unquote
+
+from http_util import JIRA_API_BASE
+
+
+REGEX_ATTACHMENT_PATH = re.compile(r"/secure/attachment/\d+/([^/?#]+)")
+REGEX_CODE_LANG = re.compile(r"\bcode-(\w+)")
+REGEX_WHITESPACE = re.compile(r"\s+")
+REGEX_BLANK_LINES = re.compile(r"\n{3,}")
+REGEX_MARKDOWN_SPECIAL = re.compile(r"([\\`*_\[\]])")
+# text at the start of a line that Markdown would read as a heading, quote, list item or setext underline
+REGEX_BLOCK_MARKER = re.compile(r"^(?:([#>+=-])|(\d+)([.)]))")
+
+BLOCK_TAGS = {"p", "div", "pre", "table", "ul", "ol", "blockquote", "h1", "h2", "h3", "h4", "h5", "h6", "hr"}
+# inline tags and their Markdown delimiters
+EMPHASIS_TAGS = {"b": "**", "strong": "**", "em": "_", "i": "_", "del": "~~", "s": "~~", "strike": "~~"}
+# inline tags which GitHub renders as-is
+PASSTHROUGH_TAGS = {"sup", "sub", "ins", "u"}
+INLINE_CODE_TAGS = {"tt", "code"}
+
+
+def resolve_url(href: str) -> str:
+    """Make Jira-relative links absolute; attachment links are reduced to the file name so that they can be replaced later
+    """
+    m = REGEX_ATTACHMENT_PATH.search(href)
+    if m:
+        return unquote(m.group(1))
+    if href.startswith("/jira/"):
+        return JIRA_API_BASE + href[len("/jira"):]
+    if href.startswith("/"):
+        return JIRA_API_BASE + href
+    return href
+
+
+class _Node(object):
+    """Output buffer of an open element whose content is post-processed on the end tag
+    """
+    def __init__(self, tag: str, attrs: dict[str, Optional[str]]):
+        self.tag = tag
+        self.attrs = attrs
+        self.parts: list[str] = []
+
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+class MarkdownConverter(HTMLParser):
+    """Convert Jira's server-rendered HTML (`renderedFields`) to GitHub flavored Markdown
+
+    This is a single pass over the HTML token stream; elements that need their whole content
+    (links, list items, code blocks, table cells, ...) are buffered on a stack until their end tag.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack: list[_Node] = [_Node("", {})]
+        self.lists: list[list] = []  # [ordered, counter]
+        self.tables: list[list[list[str]]] = []
+        self.header_rows: list[int] = []
+        self.pre_depth = 0
+
+    def __push(self, tag: str, attrs: list[tuple[str, Optional[str]]]):
+        self.stack.append(_Node(tag, dict(attrs)))
+
+    def __pop(self, tag: str) -> Optional[_Node]:
+        # tolerate unbalanced markup: close everything up to the matching start tag
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                while len(self.stack) - 1 > i:
+                    node = self.stack.pop()
+                    self.__emit(node.text())
+                return self.stack.pop()
+        return None
+
+    def __emit(self, s: str):
+        self.stack[-1].parts.append(s)
+
+    def __at_line_start(self) -> bool:
+        for part in reversed(self.stack[-1].parts):
+            if part:
+                return part.endswith("\n")
+        return True
+
+    def __block(self):
+        self.__emit("\n\n")
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, Optional[str]]]):
+        if tag == "br":
+            self.__emit("\n")
+        elif tag == "hr":
+            self.__emit("\n\n---\n\n")
+        elif tag == "img":
+            attrs = dict(attrs)
+            src = attrs.get("src")
+            if src:
+                url = resolve_url(src)
+                self.__emit(f"![{attrs.get('alt') or url.rsplit('/', 1)[-1]}]({url})")
+        elif self.pre_depth > 0:
+            # syntax highlighting spans inside code blocks
+            return
+        elif tag == "pre":
+            self.pre_depth += 1
+            self.__push(tag, attrs)
+        elif tag in ("ul", "ol"):
+            self.lists.append([tag == "ol", 0])
+            self.__emit("\n" if len(self.lists) > 1 else "\n\n")
+        elif tag == "li":
+            self.__push(tag, attrs)
+        elif tag == "table":
+            self.tables.append([])
+            self.header_rows.append(0)
+        elif tag == "tr":
+            if self.tables:
+                self.tables[-1].append([])
+        elif tag in ("td", "th"):
+            self.__push(tag, attrs)
+        elif tag in BLOCK_TAGS:
+            self.__block()
+            if tag == "blockquote" or tag.startswith("h"):
+                self.__push(tag, attrs)
+        elif tag in EMPHASIS_TAGS or tag in INLINE_CODE_TAGS or tag in PASSTHROUGH_TAGS or tag == "a":
+            self.__push(tag, attrs)
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, Optional[str]]]):
+        if tag in ("br", "hr", "img"):
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag: str):
+        if self.pre_depth > 0 and tag != "pre":
+            return
+        if tag == "pre":
+            node = self.__pop(tag)
+            self.pre_depth -= 1
+            if node is None:
+                return
+            m = REGEX_CODE_LANG.search(node.attrs.get("class") or "")
+            lang = m.group(1) if m else ""
+            code = node.text().strip("\n")
+            self.__emit(f"\n\n```{lang}\n{code}\n```\n\n")
+        elif tag in ("ul", "ol"):
+            if self.lists:
+                self.lists.pop()
+            self.__emit("\n" if self.lists else "\n\n")
+        elif tag == "li":
+            node = self.__pop(tag)
+            if node is None:
+                return
+            if self.lists:
+                self.lists[-1][1] += 1
+                bullet = f"{self.lists[-1][1]}. " if self.lists[-1][0] else "- "
+            else:
+                bullet = "- "
+            lines = REGEX_BLANK_LINES.sub("\n\n", node.text().strip()).split("\n")
+            indent = " " * len(bullet)
+            item = bullet + lines[0] + "".join(f"\n{indent}{line}" if line else "\n" for line in lines[1:])
+            self.__emit(f"{item}\n")
+        elif tag in ("td", "th"):
+            node = self.__pop(tag)
+            if node is None or not self.tables or not self.tables[-1]:
+                return
+            cell = REGEX_BLANK_LINES.sub("\n\n", node.text().strip()).replace("\n", "<br>").replace("|", "\\|")
+            row = self.tables[-1][-1]
+            row.append(cell)
+            if tag == "th" and len(self.tables[-1]) == 1:
+                self.header_rows[-1] = 1
+        elif tag == "table":
+            if not self.tables:
+                return
+            self.__emit(self.__table(self.tables.pop(), self.header_rows.pop()))
+        elif tag == "blockquote":
+            node = self.__pop(tag)
+            if node is None:
+                return
+            lines = REGEX_BLANK_LINES.sub("\n\n", node.text().strip()).split("\n")
+            self.__emit("\n\n" + "\n".join(f"> {line}" if line else ">" for line in lines) + "\n\n")
+        elif tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            node = self.__pop(tag)
+            if node is None:
+                return
+            self.__emit(f"\n\n{'#' * int(tag[1])} {node.text().strip()}\n\n")
+        elif tag in BLOCK_TAGS:
+            self.__block()
+        elif tag in EMPHASIS_TAGS:
+            node = self.__pop(tag)
+            if node is None:
+                return
+            self.__emit(self.__wrap(node.text(), EMPHASIS_TAGS[tag], EMPHASIS_TAGS[tag]))
+        elif tag in PASSTHROUGH_TAGS:
+            node = self.__pop(tag)
+            if node is None:
+                return
+            t = "ins" if tag == "u" else tag
+            self.__emit(self.__wrap(node.text(), f"<{t}>", f"</{t}>"))
+        elif tag in INLINE_CODE_TAGS:
+            node = self.__pop(tag)
+            if node is None:
+                return
+            code = node.text().replace("\\", "")
+            fence = "``" if "`" in code else "`"
+            self.__emit(self.__wrap(code, fence, fence) if code.strip() else code)
+        elif tag == "a":
+            node = self.__pop(tag)
+            if node is None:
+                return
+            self.__emit(self.__link(node))
+
+    def handle_data(self, data: str):
+        if self.pre_depth > 0:
+            self.__emit(data)
+            return
+        if self.stack[-1].tag in INLINE_CODE_TAGS:
+            self.__emit(REGEX_WHITESPACE.sub(" ", data))
+            return
+        text = REGEX_WHITESPACE.sub(" ", data)
+        if self.__at_line_start():
+            # indentation and newlines of the HTML source
+            text = text.lstrip()
+            if not text:
+                return
+        text = REGEX_MARKDOWN_SPECIAL.sub(r"\\\1", text).replace("<", "&lt;")
+        if self.__at_line_start():
+            text = REGEX_BLOCK_MARKER.sub(lambda m: f"\\{m.group(1)}" if m.group(1) else f"{m.group(2)}\\{m.group(3)}", text)
+        self.__emit(text)
+
+    @staticmethod
+    def __wrap(text: str, start: str, end: str) -> str:
+        # Markdown delimiters must touch the enclosed text; move surrounding spaces outside
+        stripped = text.strip()
+        if not stripped:
+            return text
+        lead = text[:len(text) - len(text.lstrip())]
+        trail = text[len(text.rstrip()):]
+        return f"{lead}{start}{stripped}{end}{trail}"
+
+    @staticmethod
+    def __link(node: _Node) -> str:
+        text = node.text().strip()
+        if "user-hover" in (node.attrs.get("class") or "") and node.attrs.get("rel"):
+            # user mentions ([~username]) are rendered as the display name
+            return f"@{node.attrs['rel']}"
+        href = node.attrs.get("href")
+        if not href:
+            return text
+        url = resolve_url(href)
+        if not text:
+            return f"<{url}>" if url.startswith("http") else ""
+        if text.replace("\\", "") in (href, url):
+            return f"<{url}>" if url.startswith("http") else f"[{url}]({url})"
+        return f"[{text}]({url})"
+
+    @staticmethod
+    def __table(rows: list[list[str]], header_rows: int) -> str:
+        rows = [r for r in rows if r]
+        if not rows:
+            return ""
+        ncols = max(len(r) for r in rows)
+        lines = []
+        if header_rows == 0:
+            # GitHub tables need a header row
+            lines.append("|" + " |" * ncols)
+            lines.append("|" + "---|" * ncols)
+        for i, r in enumerate(rows):
+            r = r + [""] * (ncols - len(r))
+            lines.append("| " + " | ".join(r) + " |")
+            if i == 0 and header_rows > 0:
+                lines.append("|" + "---|" * ncols)
+        return "\n\n" + "\n".join(lines) + "\n\n"
+
+    def markdown(self) -> str:
+        self.close()
+        while len(self.stack) > 1:
+            node = self.stack.pop()
+            self.__emit(node.text())
+        text = self.stack[0].text()
+        lines = [line.rstrip() for line in text.split("\n")]
+        return REGEX_BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+def html_to_markdown(html: str) -> str:
+    """Convert rendered Jira HTML to Markdown
+    """
+    converter = MarkdownConverter()
+    converter.feed(html)
+    return converter.markdown()
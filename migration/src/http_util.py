@@ -0,0 +1,150 @@
+from typing import Callable, Optional, Union
+from collections import Counter, defaultdict
+from logging import Logger
+import functools
+import math
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common import RateLimiter
+
+
+JIRA_API_BASE = "https://issues.apache.org/jira"
+GITHUB_API_BASE = "https://api.github.com"
+
+# (connect timeout, read timeout) in seconds; without timeouts a hung socket stalls the whole run
+DEFAULT_TIMEOUT_SEC = (10.0, 60.0)
+# should be larger than the number of worker threads sharing one client
+POOL_MAXSIZE = 32
+
+# retries of Jira requests that were throttled
+MAX_RETRY = 5
+RETRY_BACKOFF_SEC = 2.0
+RETRY_STATUS_CODES = [429, 503]
+
+
+ResponseHook = Callable[..., None]
+
+
+class HttpClient(requests.Session):
+    """requests.Session with a tuned connection pool, default headers and default timeout
+
+    Connections (and TLS sessions) are kept alive and reused by all requests sent through the same client.
+    Metrics or logging hooks can be registered with `add_response_hook()`; they are called with each response.
+    """
+    def __init__(self, headers: dict[str, str] = {}, timeout: Union[float, tuple[float, float]] = DEFAULT_TIMEOUT_SEC, pool_maxsize: int = POOL_MAXSIZE):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.headers.update(headers)
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().request(method, url, **kwargs)
+
+    def add_response_hook(self, hook: ResponseHook):
+        # requests calls response hooks as hook(response, **kwargs)
+        self.hooks["response"].append(hook)
+
+
+@functools.lru_cache(maxsize=None)
+def jira_client() -> HttpClient:
+    return HttpClient(headers={"Accept": "application/json"})
+
+
+@functools.lru_cache(maxsize=None)
+def github_client(token: str) -> HttpClient:
+    return HttpClient(headers={"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"})
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of already sorted values
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100.0 * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class RequestStats(object):
+    """Thread-safe per-category counters of request latency, response size and status codes
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.bytes: Counter = Counter()
+        self.statuses: dict[str, Counter] = defaultdict(Counter)
+        self.waits: Counter = Counter()
+
+    def record(self, category: str, status: int, elapsed: float, nbytes: int):
+        with self.lock:
+            self.latencies[category].append(elapsed)
+            self.bytes[category] += nbytes
+            self.statuses[category][status] += 1
+
+    def record_wait(self, category: str, sec: float):
+        """Record time spent sleeping on our side (e.g., rate limiting or backoff)
+        """
+        with self.lock:
+            self.waits[category] += sec
+
+    def summary(self) -> dict:
+        with self.lock:
+            wall_time = time.monotonic() - self.started
+            res = {"wall_time_sec": round(wall_time, 3), "requests": {}, "waits_sec": {k: round(v, 3) for k, v in self.waits.items()}}
+            for category, latencies in self.latencies.items():
+                values = sorted(latencies)
+                res["requests"][category] = {
+                    "count": len(values),
+                    "bytes": self.bytes[category],
+                    "latency_sec": {
+                        "p50": round(percentile(values, 50), 4),
+                        "p95": round(percentile(values, 95), 4),
+                        "p99": round(percentile(values, 99), 4),
+                        "max": round(values[-1], 4),
+                        "total": round(sum(values), 3),
+                    },
+                    "requests_per_sec": round(len(values) / wall_time, 3) if wall_time > 0 else 0.0,
+                    "bytes_per_sec": round(self.bytes[category] / wall_time, 1) if wall_time > 0 else 0.0,
+                    "status_codes": {str(k): v for k, v in sorted(self.statuses[category].items())},
+                }
+            return res
+
+
+def retry_after_sec(res: requests.Response) -> Optional[float]:
+    value = res.headers.get("Retry-After")
+    if value and value.strip().isdigit():
+        return float(value.strip())
+    return None
+
+
+def jira_request(method: str, url: str, limiter: RateLimiter, category: str, stats: RequestStats, logger: Logger, **kwargs) -> requests.Response:
+    """Send a request to Jira within the rate limit; backs off and retries when Jira responds with 429/503
+
+    Latency, size and status of each request are recorded in `stats` under the category.
+    For streamed responses, the caller is responsible for recording them after consuming the body.
+    """
+    retry = 0
+    while True:
+        stats.record_wait("rate_limit", limiter.acquire())
+        start = time.monotonic()
+        res = jira_client().request(method, url, **kwargs)
+        if not kwargs.get("stream"):
+            stats.record(category, res.status_code, time.monotonic() - start, len(res.content))
+        if res.status_code not in RETRY_STATUS_CODES or retry >= MAX_RETRY:
+            return res
+        if kwargs.get("stream"):
+            stats.record(category, res.status_code, time.monotonic() - start, 0)
+            res.close()
+        retry += 1
+        delay = retry_after_sec(res) or RETRY_BACKOFF_SEC * (2 ** (retry - 1))
+        logger.warning(f"Jira responded with status code={res.status_code} for {url}; backing off {delay} sec (retry={retry})")
+        # slow down all workers, not only this one
+        limiter.pause(delay)
@@ -7,13 +7,13 @@
 
 import argparse
 from pathlib import Path
-import json
 import sys
 import os
 import time
 
-from common import LOG_DIRNAME, GITHUB_IMPORT_DATA_DIRNAME, MAPPINGS_DATA_DIRNAME, ISSUE_MAPPING_FILENAME, logging_setup, jira_issue_id, github_data_file, retry_upto, MaxRetryLimitExceedException
+from common import LOG_DIRNAME, GITHUB_IMPORT_DATA_DIRNAME, MAPPINGS_DATA_DIRNAME, ISSUE_MAPPING_FILENAME, logging_setup, jira_issue_id, retry_upto, MaxRetryLimitExceedException
 from github_issues_util import *
+from dump_store import DumpStore, open_github_data_store
 
 log_dir = Path(__file__).resolve().parent.parent.joinpath(LOG_DIRNAME)
 logger = logging_setup(log_dir, "import_github_issues")
@@ -24,26 +24,24 @@ def issue_web_url(repo: str, issue_number: str) -> str:
 
 
 @retry_upto(3, 1.0, logger)
-def import_issue_with_comments(num: int, data_dir: Path, token: str, repo: str) -> Optional[tuple[str, str]]:
-    data_file = github_data_file(data_dir, num)
-    if not data_file.exists():
-        return None
-    with open(data_file) as fp:
-        issue_data = json.load(fp)
-        url = import_issue(token, repo, issue_data, logger)
-        (status, issue_url, errors) = ("pending", "", [])
-        while not status or status == "pending":
-            (status, issue_url, errors) = get_import_status(token, url, logger)
-            time.sleep(3)
-        if status == "imported":
-            issue_number = issue_url.rsplit("/", maxsplit=1)[1]
-            web_url = issue_web_url(repo, issue_number)
-            logger.debug(f"Import GitHub issue {web_url} was successfully completed.")
-            return (web_url, issue_number)
-        else:
-            logger.error(f"Import GitHub issue {data_file} was failed. status={status}, errors={errors}")
-        
+def import_issue_with_comments(num: int, data_store: DumpStore, token: str, repo: str) -> Optional[tuple[str, str]]:
+    issue_data = data_store.read(num)
+    if not issue_data:
         return None
+    url = import_issue(token, repo, issue_data, logger)
+    (status, issue_url, errors) = ("pending", "", [])
+    while not status or status == "pending":
+        (status, issue_url, errors) = get_import_status(token, url, logger)
+        time.sleep(3)
+    if status == "imported":
+        issue_number = issue_url.rsplit("/", maxsplit=1)[1]
+        web_url = issue_web_url(repo, issue_number)
+        logger.debug(f"Import GitHub issue {web_url} was successfully completed.")
+        return (web_url, issue_number)
+    else:
+        logger.error(f"Import GitHub issue {data_store.location(num)} was failed. status={status}, errors={errors}")
+
+    return None
 
 
 if __name__ == "__main__":
@@ -68,6 +66,7 @@ if __name__ == "__main__":
     if not github_data_dir.exists():
         logger.error(f"GitHub data dir not exists. {github_data_dir}")
         sys.exit(1)
+    github_data_store = open_github_data_store(github_data_dir)
     
     mapping_data_dir = Path(__file__).resolve().parent.parent.joinpath(MAPPINGS_DATA_DIRNAME)
     if not mapping_data_dir.exists():
@@ -89,7 +88,7 @@ if __name__ == "__main__":
     logger.info(f"Importing GitHub issues")
     for num in issues:
         try:
-            res = import_issue_with_comments(num, github_data_dir, github_token, github_repo)
+            res = import_issue_with_comments(num, github_data_store, github_token, github_repo)
             if res:
                 (issue_url, issue_number) = res
                 with open(issue_mapping_file, "a") as fp:
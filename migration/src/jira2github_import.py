@@ -3,22 +3,61 @@
 # Usage:
 #   python src/jira2github_import.py --issues <issue number list>
 #   python src/jira2github_import.py --min <min issue number> --max <max issue number>
+#   python src/jira2github_import.py --min <min issue number> --max <max issue number> --engine html
+#   python src/jira2github_import.py --min <min issue number> --max <max issue number> --jobs <number of processes>
+#   python src/jira2github_import.py --min <min issue number> --max <max issue number> --jobs <number of processes> --split-size <characters>
+#   python src/jira2github_import.py --min <min issue number> --max <max issue number> --time-budget <seconds per text>
+#   python src/jira2github_import.py --min <min issue number> --max <max issue number> --compact-json
+#   python src/jira2github_import.py --min <min issue number> --max <max issue number> --force
 #
 
 import argparse
+from typing import Any, Callable, Optional
 from pathlib import Path
-import json
+from collections import Counter
+from datetime import datetime
 import sys
 from urllib.parse import quote
 import os
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+import itertools
+from logging.handlers import QueueHandler, QueueListener
 
-from common import LOG_DIRNAME, JIRA_DUMP_DIRNAME, GITHUB_IMPORT_DATA_DIRNAME, MAPPINGS_DATA_DIRNAME, ACCOUNT_MAPPING_FILENAME, ISSUE_TYPE_TO_LABEL_MAP, COMPONENT_TO_LABEL_MAP, \
-    logging_setup, jira_issue_url, jira_dump_file, jira_issue_id, github_data_file, make_github_title, read_account_map
+from common import LOG_DIRNAME, JIRA_DUMP_DIRNAME, GITHUB_IMPORT_DATA_DIRNAME, MAPPINGS_DATA_DIRNAME, ACCOUNT_MAPPING_FILENAME, ATTACHMENT_PLAN_FILENAME, CONVERT_CACHE_DIRNAME, CONVERT_CACHE_FILENAME, CONVERT_MANIFEST_FILENAME, ISSUE_TYPE_TO_LABEL_MAP, COMPONENT_TO_LABEL_MAP, \
+    logging_setup, jira_issue_url, jira_issue_id, make_github_title, read_account_map
 from jira_util import *
+from dump_store import DumpStore, open_jira_dump_store, open_github_data_store
+from dump_index import DumpIndex, open_synced_index
+from attachment_plan import AttachmentPlan
+from convert_cache import DEFAULT_CACHE_SIZE_MB, ConvertCache
+from convert_manifest import ConvertManifest, input_hash
+import json_util
 
 log_dir = Path(__file__).resolve().parent.parent.joinpath(LOG_DIRNAME)
 logger = logging_setup(log_dir, "jira2github_import")
 
+# convert Jira markup with jira2markdown
+ENGINE_JIRA2MARKDOWN = "jira2markdown"
+# convert the HTML rendered by Jira (issues must be downloaded with `--expand renderedFields`)
+ENGINE_HTML = "html"
+
+# upper limit of issues sent to a worker process at once; small enough to balance the load
+MAX_CHUNK_SIZE = 50
+
+# issues with more description/comment text than this (in characters) are converted in several tasks of about this size with --jobs
+DEFAULT_SPLIT_SIZE = 20_000
+
+# default time budget of the markup grammar per description/comment in seconds
+DEFAULT_TIME_BUDGET = 60.0
+
+# bump this when the GitHub issue data made from the converted texts changes (e.g., the description template);
+# the conversion manifest then marks all issues stale while cached text conversions are still used (see CONVERTER_VERSION in jira_util.py)
+OUTPUT_VERSION = "2"
+
+# texts that could not be converted within the time budget and were emitted as raw blocks
+slow_inputs: list[dict] = []
+
 
 def attachment_url(issue_num: int, filename: str, att_repo: str, att_branch: str) -> str:
     return f"https://github.com/{att_repo}/blob/{att_branch}/attachments/{jira_issue_id(issue_num)}/{quote(filename)}"
@@ -34,58 +73,124 @@ def jira_timestamp_to_github_timestamp(ts: str) -> str:
     return ts[:-9] + "Z"
 
 
-def convert_issue(num: int, dump_dir: Path, output_dir: Path, account_map: dict[str, str], att_repo: str, att_branch: str) -> bool:
-    jira_id = jira_issue_id(num)
-    dump_file = jira_dump_file(dump_dir, num)
-    if not dump_file.exists():
-        logger.warning(f"Jira dump file not found: {dump_file}")
+def convert_issue(num: int, dump_store: DumpStore, output_store: DumpStore, account_map: dict[str, str], att_repo: str, att_branch: str, engine: str = ENGINE_JIRA2MARKDOWN, plan: Optional[AttachmentPlan] = None) -> bool:
+    data = convert_issue_data(num, dump_store, account_map, att_repo, att_branch, engine, plan)
+    if data is None:
         return False
+    location = output_store.write(num, data)
+    logger.debug(f"GitHub issue data created: {location}")
+    return True
+
 
-    with open(dump_file) as fp:
-        o = json.load(fp)
-        summary = extract_summary(o).strip()
-        description = extract_description(o).strip()
-        status = extract_status(o)
-        issue_type = extract_issue_type(o)
-        (reporter_name, reporter_dispname) = extract_reporter(o)
-        (assignee_name, assignee_dispname) = extract_assignee(o)
-        created = extract_created(o)
-        updated = extract_updated(o)
-        resolutiondate = extract_resolutiondate(o)
-        fix_versions = extract_fixversions(o)
-        versions = extract_versions(o)
-        components = extract_components(o)
-        attachments = extract_attachments(o)
-        linked_issues = extract_issue_links(o)
-        subtasks = extract_subtasks(o)
-        pull_requests =extract_pull_requests(o)
-
-        reporter_gh = account_map.get(reporter_name)
-        reporter = f"{reporter_dispname} ({may_markup(reporter_gh)})" if reporter_gh else f"{reporter_dispname}"
-        assignee_gh = account_map.get(assignee_name)
-        assignee = f"{assignee_dispname} ({may_markup(assignee_gh)})" if assignee_gh else f"{assignee_dispname}"
-
-        # make attachment list
-        attachment_list_items = []
-        att_replace_map = {}
-        for (filename, cnt) in attachments:
-            attachment_list_items.append(f"- [{filename}]({attachment_url(num, filename, att_repo, att_branch)})" + (f" (versions: {cnt})\n" if cnt > 1 else "\n"))
-            att_replace_map[filename] = attachment_url(num, filename, att_repo, att_branch)
-
-        # embed github issue number next to linked issue keys
-        linked_issues_list_items = []
-        for jira_key in linked_issues:
-            linked_issues_list_items.append(f"- {jira_key} : [Jira link]({jira_issue_url(jira_key)})\n")
-        
-        # embed github issue number next to sub task keys
-        subtasks_list_items = []
-        for jira_key in subtasks:
-            subtasks_list_items.append(f"- {jira_key} : [Jira link]({jira_issue_url(jira_key)})\n")
-
-        # make pull requests list
-        pull_requests_list = [f"- {x}\n" for x in pull_requests]
-
-        body = f"""{convert_text(description, att_replace_map)}
+def attachment_list(num: int, issue: JiraIssue, att_repo: str, att_branch: str, plan: Optional[AttachmentPlan]) -> tuple[list[str], dict[str, str]]:
+    """Markdown list items of the attached files and the map of file names to their URLs in the attachment repo
+    """
+    attachment_list_items = []
+    att_replace_map = {}
+    skipped_attachments = plan.skipped_files(num) if plan else {}
+    for (a, cnt) in issue.attachment_files():
+        filename = a.filename
+        if filename in skipped_attachments:
+            # excluded from the download by the attachment plan
+            attachment_list_items.append(f"- {filename}" + (f" (versions: {cnt})" if cnt > 1 else "") + f" (not migrated: {skipped_attachments[filename]})\n")
+            continue
+        attachment_list_items.append(f"- [{filename}]({attachment_url(num, filename, att_repo, att_branch)})" + (f" (versions: {cnt})\n" if cnt > 1 else "\n"))
+        att_replace_map[filename] = attachment_url(num, filename, att_repo, att_branch)
+    return (attachment_list_items, att_replace_map)
+
+
+def issue_texts(issue: JiraIssue, engine: str) -> list[tuple[str, Optional[str], str]]:
+    """Texts to be converted: (Jira markup, HTML rendered by Jira or None, field name) of the description and then each comment
+    """
+    (rendered_description, rendered_comments) = (None, None)
+    if engine == ENGINE_HTML:
+        rendered_description = issue.rendered_description
+        if issue.rendered_comments is not None and len(issue.rendered_comments) == len(issue.comments):
+            rendered_comments = issue.rendered_comments
+    texts = [(issue.description.strip(), rendered_description, "description")]
+    for (i, c) in enumerate(issue.comments):
+        texts.append((c.body, rendered_comments[i] if rendered_comments is not None else None, f"comment {i + 1}"))
+    return texts
+
+
+def convert_body(jira_id: str, text: str, html: Optional[str], field: str, att_replace_map: dict[str, str]) -> str:
+    if html is not None:
+        return convert_html(html, att_replace_map)
+    try:
+        return convert_text(text, att_replace_map)
+    except ConversionTimeout as e:
+        logger.warning(f"Emitting {field} of {jira_id} as is: {str(e)}")
+        slow_inputs.append({"issue": jira_id, "field": field, "length": len(text)})
+        return raw_block(text)
+
+
+def convert_texts(jira_id: str, texts: list[tuple[str, Optional[str], str]], att_replace_map: dict[str, str]) -> list[str]:
+    return [convert_body(jira_id, text, html, field, att_replace_map) for (text, html, field) in texts]
+
+
+def convert_issue_data(num: int, dump_store: DumpStore, account_map: dict[str, str], att_repo: str, att_branch: str, engine: str = ENGINE_JIRA2MARKDOWN, plan: Optional[AttachmentPlan] = None,
+                       converted_texts: Optional[list[str]] = None, issue: Optional[JiraIssue] = None) -> Optional[dict]:
+    """Convert a Jira dump to GitHub issue data; returns None if the dump does not exist
+
+    `converted_texts` are the description and the comments (see issue_texts()) if they were already converted, e.g. in several tasks.
+    `issue` is the parsed dump if it was already read; the dump store is not read then.
+    """
+    jira_id = jira_issue_id(num)
+    if issue is None:
+        o = dump_store.read(num)
+        if not o:
+            logger.warning(f"Jira dump not found: {jira_id}")
+            return None
+        issue = parse_issue(o)
+
+    summary = issue.summary.strip()
+    status = issue.status
+    issue_type = issue.issue_type
+    (reporter_name, reporter_dispname) = issue.reporter
+    (assignee_name, assignee_dispname) = issue.assignee
+    created = issue.created
+    updated = issue.updated
+    resolutiondate = issue.resolutiondate
+    fix_versions = issue.fix_versions
+    versions = issue.versions
+    components = issue.components
+    linked_issues = issue.issue_links
+    subtasks = issue.subtasks
+    (pull_requests, commits, svn_revisions) = issue.activity()
+
+    reporter_gh = account_map.get(reporter_name)
+    reporter = f"{reporter_dispname} ({may_markup(reporter_gh)})" if reporter_gh else f"{reporter_dispname}"
+    assignee_gh = account_map.get(assignee_name)
+    assignee = f"{assignee_dispname} ({may_markup(assignee_gh)})" if assignee_gh else f"{assignee_dispname}"
+
+    # make attachment list
+    (attachment_list_items, att_replace_map) = attachment_list(num, issue, att_repo, att_branch, plan)
+
+    # embed github issue number next to linked issue keys
+    linked_issues_list_items = []
+    for jira_key in linked_issues:
+        linked_issues_list_items.append(f"- {jira_key} : [Jira link]({jira_issue_url(jira_key)})\n")
+    
+    # embed github issue number next to sub task keys
+    subtasks_list_items = []
+    for jira_key in subtasks:
+        subtasks_list_items.append(f"- {jira_key} : [Jira link]({jira_issue_url(jira_key)})\n")
+
+    # make pull requests list (followed by the commits and SVN revisions)
+    pull_requests_list = [f"- {x}\n" for x in pull_requests]
+    pull_requests_list.extend(f"- https://github.com/apache/{repo}/commit/{hash}\n" for (repo, hash) in commits)
+    pull_requests_list.extend(f"- https://svn.apache.org/r{rev}\n" for rev in svn_revisions)
+
+    comments = issue.comments
+    if engine == ENGINE_HTML:
+        if issue.rendered_description is None:
+            logger.debug(f"Rendered fields not found, falling back to Jira markup: {jira_id}")
+        if issue.rendered_comments is not None and len(issue.rendered_comments) != len(comments):
+            logger.warning(f"Rendered comments do not match the comments, falling back to Jira markup: {jira_id}")
+    if converted_texts is None:
+        converted_texts = convert_texts(jira_id, issue_texts(issue, engine), att_replace_map)
+
+    body = f"""{converted_texts[0]}
 
 ---
 ### Jira information
@@ -109,63 +214,303 @@ Pull Requests:
 {"".join(pull_requests_list)}
 """
 
-        def comment_author(author_name, author_dispname):
-            author_gh = account_map.get(author_name)
-            return f"{author_dispname} ({may_markup(author_gh)})" if author_gh else author_dispname
-        
-        comments = extract_comments(o)
-        comments_data = []
-        for (comment_author_name, comment_author_dispname, comment_body, comment_created, comment_updated) in comments:
-            data = {
-                "body": f"""{convert_text(comment_body, att_replace_map)}
-
-Author: {comment_author(comment_author_name, comment_author_dispname)}
-Created: {comment_created}
-Updated: {comment_updated}
-"""
-            }
-            if comment_created:
-                data["created_at"] = jira_timestamp_to_github_timestamp(comment_created)
-            comments_data.append(data)
-
-        labels = []
-        if issue_type and ISSUE_TYPE_TO_LABEL_MAP.get(issue_type):
-            labels.append(ISSUE_TYPE_TO_LABEL_MAP.get(issue_type))
-        # milestone?
-        for v in fix_versions:
-            if v:
-                labels.append(f"fixVersion:{v}")
-        for v in versions:
-            if v:
-                labels.append(f"affectsVersion:{v}")
-        for c in components:
-            if c.startswith("core"):
-                labels.append(f"component:module/{c}")
-            elif c in COMPONENT_TO_LABEL_MAP:
-                labels.append(COMPONENT_TO_LABEL_MAP.get(c))
-
+    def comment_author(author_name, author_dispname):
+        author_gh = account_map.get(author_name)
+        return f"{author_dispname} ({may_markup(author_gh)})" if author_gh else author_dispname
+    
+    comments_data = []
+    for i, c in enumerate(comments):
         data = {
-            "issue": {
-                "title": make_github_title(summary, jira_id),
-                "body": body,
-                "closed": status in ["Closed", "Resolved"],
-                "labels": labels,
-            },
-            "comments": comments_data
+            "body": f"""{converted_texts[i + 1]}
+
+Author: {comment_author(c.author_name, c.author_dispname)}
+Created: {c.created}
+Updated: {c.updated}
+"""
         }
-        if created:
-            data["issue"]["created_at"] = jira_timestamp_to_github_timestamp(created)
-        if updated:
-            data["issue"]["updated_at"] = jira_timestamp_to_github_timestamp(updated)
-        if resolutiondate:
-            data["issue"]["closed_at"] = jira_timestamp_to_github_timestamp(resolutiondate)
-
-        data_file = github_data_file(output_dir, num)
-        with open(data_file, "w") as fp:
-            json.dump(data, fp, indent=2)
-
-    logger.debug(f"GitHub issue data created: {data_file}")
-    return True
+        if c.created:
+            data["created_at"] = jira_timestamp_to_github_timestamp(c.created)
+        comments_data.append(data)
+
+    labels = []
+    if issue_type and ISSUE_TYPE_TO_LABEL_MAP.get(issue_type):
+        labels.append(ISSUE_TYPE_TO_LABEL_MAP.get(issue_type))
+    # milestone?
+    for v in fix_versions:
+        if v:
+            labels.append(f"fixVersion:{v}")
+    for v in versions:
+        if v:
+            labels.append(f"affectsVersion:{v}")
+    for c in components:
+        if c.startswith("core"):
+            labels.append(f"component:module/{c}")
+        elif c in COMPONENT_TO_LABEL_MAP:
+            labels.append(COMPONENT_TO_LABEL_MAP.get(c))
+
+    data = {
+        "issue": {
+            "title": make_github_title(summary, jira_id),
+            "body": body,
+            "closed": status in ["Closed", "Resolved"],
+            "labels": labels,
+        },
+        "comments": comments_data
+    }
+    if created:
+        data["issue"]["created_at"] = jira_timestamp_to_github_timestamp(created)
+    if updated:
+        data["issue"]["updated_at"] = jira_timestamp_to_github_timestamp(updated)
+    if resolutiondate:
+        data["issue"]["closed_at"] = jira_timestamp_to_github_timestamp(resolutiondate)
+    return data
+
+
+def issue_inputs(num: int, entry: dict, account_map: dict[str, str], att_repo: str, att_branch: str, engine: str, plan: Optional[AttachmentPlan]) -> dict[str, str]:
+    """Hashes of the inputs of the GitHub issue data, recorded in the conversion manifest
+
+    The inputs are taken from the dump index entry of the issue, so no dump is read. The dump is identified by its `updated` timestamp and stored size.
+    Only the account map entries of the users in the issue are included, so that adding an account does not make all issues stale.
+    """
+    names = sorted({name for (name, _) in entry["users"]})
+    return {
+        "dump": input_hash(entry["updated"], entry["size"]),
+        "accounts": input_hash([[name, account_map.get(name)] for name in names]),
+        "attachments": input_hash(att_repo, att_branch, plan.skipped_files(num) if plan else {}),
+        "converter": input_hash(converter_version(), OUTPUT_VERSION, engine),
+    }
+
+
+def stale_issues(issues: list[int], index: DumpIndex, output_store: DumpStore, manifest: ConvertManifest, account_map: dict[str, str], att_repo: str, att_branch: str, engine: str,
+                 plan: Optional[AttachmentPlan], force: bool) -> tuple[list[int], dict[int, dict[str, str]]]:
+    """Issues to be converted and the input hashes of all issues that have a dump
+
+    Issues whose GitHub data exist and whose inputs match the manifest are left out unless `force` is set.
+    """
+    (stale, inputs) = ([], {})
+    for num in issues:
+        entry = index.get(num)
+        if not entry:
+            # reported by the conversion
+            stale.append(num)
+            continue
+        inputs[num] = issue_inputs(num, entry, account_map, att_repo, att_branch, engine, plan)
+        if force or not output_store.exists(num):
+            stale.append(num)
+            continue
+        changed = manifest.changed_inputs(num, inputs[num])
+        if changed:
+            logger.debug(f"{jira_issue_id(num)} is stale; changed inputs: {', '.join(changed)}")
+            stale.append(num)
+    return (stale, inputs)
+
+
+def record_conversion(manifest: ConvertManifest, num: int, inputs: Optional[dict[str, str]], emitted_as_is: bool):
+    # texts emitted as is depend on the time budget, so such issues are converted again on the next run
+    if inputs and not emitted_as_is:
+        manifest.record(num, inputs)
+    else:
+        manifest.forget(num)
+
+
+# conversion settings of a worker process (set by init_worker())
+worker_context: dict = {}
+
+
+def open_convert_cache(cache_file: Optional[Path], cache_size_mb: int) -> Optional[ConvertCache]:
+    if not cache_file:
+        return None
+    return ConvertCache(cache_file, converter_version(), cache_size_mb * 1024 * 1024)
+
+
+def conversion_counts(cache: Optional[ConvertCache]) -> Counter:
+    """Cache hits/misses and numbers of texts converted with and without the grammar in this process so far
+    """
+    counts = Counter(markup_stats)
+    if cache:
+        counts.update(hits=cache.hits, misses=cache.misses)
+    return counts
+
+
+def write_slow_input_report(entries: list[dict], time_budget: float) -> Path:
+    report_file = log_dir.joinpath(f'slow_inputs_{datetime.now().isoformat(timespec="seconds")}.json')
+    json_util.dump_file(report_file, {"time_budget": time_budget, "inputs": entries}, pretty=True)
+    return report_file
+
+
+def init_worker(dump_dir: Path, account_map: dict[str, str], att_repo: str, att_branch: str, engine: str, plan: Optional[AttachmentPlan], cache_file: Optional[Path], cache_size_mb: int, time_budget: float,
+                log_queue: multiprocessing.Queue):
+    # log records are sent to the parent process
+    logger.handlers = [QueueHandler(log_queue)]
+    set_time_budget(time_budget)
+    cache = open_convert_cache(cache_file, cache_size_mb)
+    set_convert_cache(cache)
+    worker_context.update(dump_store=open_jira_dump_store(dump_dir), account_map=account_map, att_repo=att_repo, att_branch=att_branch, engine=engine, plan=plan, cache=cache)
+    # build the grammar once per process
+    markup_grammar()
+
+
+def run_task(func: Callable[[], Any]) -> tuple[Any, Optional[str], Counter, list[dict]]:
+    """Run a conversion task in a worker process
+
+    Returns (result, error message, conversion counts of the task, slow inputs of the task).
+    """
+    cache = worker_context["cache"]
+    counts = conversion_counts(cache)
+    slow_inputs.clear()
+    try:
+        res = (func(), None)
+    except Exception as e:
+        res = (None, f"{type(e).__name__}: {str(e)}")
+    if cache:
+        # workers are not notified when the pool shuts down, so the parent evicts over-cap entries after the pool exits (see convert_issues_parallel())
+        cache.flush()
+    return res + (conversion_counts(cache) - counts, list(slow_inputs))
+
+
+def convert_issue_in_worker(num: int) -> tuple[int, Optional[dict], Optional[str], Counter, list[dict]]:
+    """Convert an issue in a worker process
+
+    Returns (issue number, GitHub issue data, error message, conversion counts of the issue, slow inputs of the issue).
+    """
+    c = worker_context
+    return (num,) + run_task(lambda: convert_issue_data(num, c["dump_store"], c["account_map"], c["att_repo"], c["att_branch"], c["engine"], c["plan"]))
+
+
+def convert_texts_in_worker(jira_id: str, texts: list[tuple[str, Optional[str], str]], att_replace_map: dict[str, str]) -> tuple[Optional[list[str]], Optional[str], Counter, list[dict]]:
+    """Convert some texts (see issue_texts()) of a split issue in a worker process; the parent process reads the dump and sends the texts
+
+    Returns (converted texts, error message, conversion counts of the task, slow inputs of the task).
+    """
+    return run_task(lambda: convert_texts(jira_id, texts, att_replace_map))
+
+
+def split_ranges(sizes: list[int], split_size: int) -> list[tuple[int, int]]:
+    """Split the texts of an issue (their sizes in characters) into consecutive ranges of about `split_size` characters
+
+    Returns a single range if the texts are not larger than `split_size` in total (or `split_size` is 0).
+    """
+    if split_size <= 0 or sum(sizes) <= split_size:
+        return [(0, len(sizes))]
+    ranges = []
+    (start, size) = (0, 0)
+    for (i, n) in enumerate(sizes):
+        if size > 0 and size + n > split_size:
+            ranges.append((start, i))
+            (start, size) = (i, 0)
+        size += n
+    ranges.append((start, len(sizes)))
+    return ranges
+
+
+def indexed_text_sizes(entry: dict, engine: str) -> list[int]:
+    """Sizes in characters of the texts of an indexed issue (see issue_texts()) as converted by the engine
+    """
+    html_sizes = entry["html_sizes"] if engine == ENGINE_HTML and entry["html_sizes"] is not None else [None] * len(entry["text_sizes"])
+    return [html if html is not None else text for (text, html) in zip(entry["text_sizes"], html_sizes)]
+
+
+def split_issues(issues: list[int], index: DumpIndex, engine: str, split_size: int) -> dict[int, list[tuple[int, int]]]:
+    """Issues that are converted in several tasks, and the ranges of their texts (see issue_texts()) converted by each task
+
+    The issues are ordered by their total text size, the largest first. The text sizes are taken from the dump index, so no dump is read.
+    """
+    if split_size <= 0:
+        return {}
+    res = []
+    for num in issues:
+        entry = index.get(num)
+        if not entry:
+            continue
+        sizes = indexed_text_sizes(entry, engine)
+        ranges = split_ranges(sizes, split_size)
+        if len(ranges) > 1:
+            res.append((sum(sizes), num, ranges))
+    return {num: ranges for (_, num, ranges) in sorted(res, key=lambda x: x[0], reverse=True)}
+
+
+def join_split_issue(num: int, issue: JiraIssue, futures: list[Future], dump_store: DumpStore, account_map: dict[str, str], att_repo: str, att_branch: str, engine: str,
+                     plan: Optional[AttachmentPlan]) -> tuple[int, Optional[dict], Optional[str], Counter, list[dict]]:
+    """Wait for the tasks of a split issue and make the GitHub issue data from their converted texts and the parsed dump in this process
+
+    Returns the same as convert_issue_in_worker().
+    """
+    (texts, error, counts, slow) = ([], None, Counter(), [])
+    for f in futures:
+        (converted, task_error, task_counts, task_slow) = f.result()
+        counts.update(task_counts)
+        slow.extend(task_slow)
+        if task_error:
+            error = error or task_error
+        else:
+            texts.extend(converted)
+    if error:
+        return (num, None, error, counts, slow)
+    try:
+        return (num, convert_issue_data(num, dump_store, account_map, att_repo, att_branch, engine, plan, texts, issue), None, counts, slow)
+    except Exception as e:
+        return (num, None, f"{type(e).__name__}: {str(e)}", counts, slow)
+
+
+def convert_issues_parallel(issues: list[int], jobs: int, dump_dir: Path, index: DumpIndex, output_store: DumpStore, account_map: dict[str, str], att_repo: str, att_branch: str, engine: str, plan: Optional[AttachmentPlan],
+                            cache_file: Optional[Path], cache_size_mb: int, time_budget: float, manifest: ConvertManifest, inputs: dict[int, dict[str, str]],
+                            split_size: int = DEFAULT_SPLIT_SIZE) -> tuple[int, int, Counter, list[dict]]:
+    """Convert issues on a process pool; GitHub issue data and the manifest are written by this (parent) process
+
+    The texts of issues larger than `split_size` characters are converted in several tasks, so that a giant issue is spread over the workers
+    instead of keeping one worker busy after the others have finished; see split_issues(). The dumps of such issues are read once, by this process.
+    Returns the numbers of converted and failed issues, the conversion counts (see conversion_counts()) of all workers and the slow inputs.
+    """
+    dump_store = open_jira_dump_store(dump_dir)
+    splits = split_issues(issues, index, engine, split_size)
+    if splits:
+        logger.info(f"Converting {len(splits)} large issues in {sum(len(ranges) for ranges in splits.values())} tasks")
+    rest = [num for num in issues if num not in splits]
+    log_queue = multiprocessing.Queue()
+    listener = QueueListener(log_queue, *logger.handlers, respect_handler_level=True)
+    listener.start()
+    chunksize = max(1, min(MAX_CHUNK_SIZE, len(rest) // (jobs * 4)))
+    (converted, failed, counts, slow) = (0, 0, Counter(), [])
+    try:
+        initargs = (dump_dir, account_map, att_repo, att_branch, engine, plan, cache_file, cache_size_mb, time_budget, log_queue)
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=initargs) as executor:
+            # tasks are started in the order of submission; the tasks of split issues go first (the largest issue first) so that they do not finish last
+            split_tasks = []
+            for (num, ranges) in splits.items():
+                o = dump_store.read(num)
+                if not o:
+                    # removed after the index was synced
+                    logger.warning(f"Jira dump not found: {jira_issue_id(num)}")
+                    failed += 1
+                    continue
+                issue = parse_issue(o)
+                texts = issue_texts(issue, engine)
+                (_, att_replace_map) = attachment_list(num, issue, att_repo, att_branch, plan)
+                split_tasks.append((num, issue, [executor.submit(convert_texts_in_worker, jira_issue_id(num), texts[start:end], att_replace_map) for (start, end) in ranges]))
+            results = itertools.chain(executor.map(convert_issue_in_worker, rest, chunksize=chunksize),
+                                      (join_split_issue(num, issue, futures, dump_store, account_map, att_repo, att_branch, engine, plan) for (num, issue, futures) in split_tasks))
+            for (num, data, error, issue_counts, issue_slow_inputs) in results:
+                counts.update(issue_counts)
+                slow.extend(issue_slow_inputs)
+                if error:
+                    logger.error(f"Failed to convert {jira_issue_id(num)}. error={error}")
+                    manifest.forget(num)
+                    failed += 1
+                elif data is not None:
+                    location = output_store.write(num, data)
+                    logger.debug(f"GitHub issue data created: {location}")
+                    record_conversion(manifest, num, inputs.get(num), bool(issue_slow_inputs))
+                    converted += 1
+                else:
+                    # the dump was not found (logged by the worker)
+                    failed += 1
+        # workers check the size cap only every so many writes and never close their caches; enforce the cap once all of them have exited
+        cache = open_convert_cache(cache_file, cache_size_mb)
+        if cache:
+            cache.close()
+    finally:
+        listener.stop()
+    return (converted, failed, counts, slow)
 
 
 if __name__ == "__main__":
@@ -182,12 +527,23 @@ if __name__ == "__main__":
     parser.add_argument('--issues', type=int, required=False, nargs='*', help='Jira issue number list to be downloaded')
     parser.add_argument('--min', type=int, dest='min', required=False, default=1, help='Minimum Jira issue number to be converted')
     parser.add_argument('--max', type=int, dest='max', required=False, help='Maximum Jira issue number to be converted')
+    parser.add_argument('--sharded', action='store_true', help='Store GitHub data in compressed shards instead of one JSON file per issue')
+    parser.add_argument('--compact-json', action='store_true', help='Write GitHub data files without indentation (smaller and faster to write; shards are always compact)')
+    parser.add_argument('--jobs', type=int, dest='jobs', required=False, default=1, help='Number of worker processes')
+    parser.add_argument('--split-size', type=int, dest='split_size', required=False, default=DEFAULT_SPLIT_SIZE, help='With --jobs, issues with more description/comment text than this (in characters) are converted in several tasks (0: never split)')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the cache of converted texts')
+    parser.add_argument('--cache-size', type=int, dest='cache_size', required=False, default=DEFAULT_CACHE_SIZE_MB, help='Size cap of the cache of converted texts in MB')
+    parser.add_argument('--time-budget', type=float, dest='time_budget', required=False, default=DEFAULT_TIME_BUDGET, help='Time limit of the markup conversion per description/comment in seconds (0: no limit); texts over the limit are emitted as is')
+    parser.add_argument('--engine', type=str, dest='engine', required=False, default=ENGINE_JIRA2MARKDOWN, choices=[ENGINE_JIRA2MARKDOWN, ENGINE_HTML], help='Conversion engine for descriptions and comments')
+    parser.add_argument('--force', action='store_true', help='Convert all issues, including ones that are up to date according to the conversion manifest')
     args = parser.parse_args()
 
     dump_dir = Path(__file__).resolve().parent.parent.joinpath(JIRA_DUMP_DIRNAME)
     if not dump_dir.exists():
         logger.error(f"Jira dump dir not exists: {dump_dir}")
         sys.exit(1)
+    dump_store = open_jira_dump_store(dump_dir)
+    index = open_synced_index(dump_dir, dump_store)
 
     mappings_dir = Path(__file__).resolve().parent.parent.joinpath(MAPPINGS_DATA_DIRNAME)
     account_mapping_file = mappings_dir.joinpath(ACCOUNT_MAPPING_FILENAME)
@@ -196,9 +552,13 @@ if __name__ == "__main__":
     if not output_dir.exists():
         output_dir.mkdir()
     assert output_dir.exists()
+    output_store = open_github_data_store(output_dir, True if args.sharded else None, not args.compact_json)
 
     account_map = read_account_map(account_mapping_file) if account_mapping_file else {}
 
+    plan_file = dump_dir.joinpath(ATTACHMENT_PLAN_FILENAME)
+    plan = AttachmentPlan(plan_file) if plan_file.exists() else None
+
     issues = []
     if args.issues:
         issues = args.issues
@@ -208,9 +568,53 @@ if __name__ == "__main__":
         else:
             issues.append(args.min)
 
-    logger.info(f"Converting Jira issues to GitHub issues in {output_dir}")
-    for num in issues:
-        convert_issue(num, dump_dir, output_dir, account_map, github_att_repo, github_att_branch)
-    
+    cache_file = None
+    if not args.no_cache:
+        cache_dir = Path(__file__).resolve().parent.parent.joinpath(CONVERT_CACHE_DIRNAME)
+        if not cache_dir.exists():
+            cache_dir.mkdir()
+        cache_file = cache_dir.joinpath(CONVERT_CACHE_FILENAME)
+
+    manifest = ConvertManifest(output_dir.joinpath(CONVERT_MANIFEST_FILENAME))
+    (stale, inputs) = stale_issues(issues, index, output_store, manifest, account_map, github_att_repo, github_att_branch, args.engine, plan, args.force)
+    if len(stale) < len(issues):
+        logger.info(f"Skipped {len(issues) - len(stale)} of {len(issues)} issues that are up to date (use --force to convert them)")
+
+    logger.info(f"Converting Jira issues to GitHub issues in {output_dir} (jobs={args.jobs})")
+    try:
+        if args.jobs > 1:
+            (converted, failed, counts, slow) = convert_issues_parallel(stale, args.jobs, dump_dir, index, output_store, account_map, github_att_repo, github_att_branch, args.engine, plan, cache_file, args.cache_size,
+                                                                       args.time_budget, manifest, inputs, args.split_size)
+        else:
+            (converted, failed) = (0, 0)
+            cache = open_convert_cache(cache_file, args.cache_size)
+            set_convert_cache(cache)
+            set_time_budget(args.time_budget)
+            try:
+                for num in stale:
+                    num_slow = len(slow_inputs)
+                    if convert_issue(num, dump_store, output_store, account_map, github_att_repo, github_att_branch, args.engine, plan):
+                        record_conversion(manifest, num, inputs.get(num), len(slow_inputs) > num_slow)
+                        converted += 1
+                    else:
+                        failed += 1
+            finally:
+                if cache:
+                    cache.close()
+            counts = conversion_counts(cache)
+            slow = slow_inputs
+    finally:
+        # the GitHub data are synced before the manifest refers to them
+        output_store.close()
+        manifest.save()
+    logger.info(f"Converted {converted} issues, failed {failed} issues.")
+    if cache_file:
+        (hits, misses) = (counts["hits"], counts["misses"])
+        logger.info(f"Conversion cache: hits={hits}, misses={misses}, hit rate={hits / max(hits + misses, 1):.1%}")
+    (plain, markup) = (counts["plain"], counts["markup"])
+    logger.info(f"Markup-free texts: {plain} of {plain + markup} converted texts skipped the grammar ({plain / max(plain + markup, 1):.1%})")
+    if slow:
+        report_file = write_slow_input_report(slow, args.time_budget)
+        logger.warning(f"{len(slow)} texts exceeded the time budget and were emitted as is. See {report_file}")
     logger.info("Done.")
 
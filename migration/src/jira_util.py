@@ -1,187 +1,415 @@
 import re
-from dataclasses import dataclass
 from collections import defaultdict
 from typing import Optional
+from contextlib import contextmanager
+import functools
+import importlib.metadata
+import signal
+import threading
 
+# importing jira2markdown sets the default whitespace characters of pyparsing used by the grammar
 import jira2markdown
+from jira2markdown.elements import MarkupElements
+from jira2markdown.markup.lists import List as MarkupList
+from pyparsing import Forward, MatchFirst
 
+from html_util import html_to_markdown
+from convert_cache import ConvertCache
 
-@dataclass
-class Attachment(object):
-    filename: str
-    created: str
-    content: str
-    mime_type: str
 
+# bump this when the conversion output changes; cached conversions of other versions are not used
+CONVERTER_VERSION = "3"
 
-def extract_summary(o: dict) -> str:
-    return o.get("fields").get("summary", "")
+# optional persistent cache of converted texts (see set_convert_cache())
+text_cache: Optional[ConvertCache] = None
 
+# numbers of Jira markup texts converted in this process without ("plain") and with ("markup") the grammar
+markup_stats = {"plain": 0, "markup": 0}
 
-def extract_description(o: dict) -> str:
-    description = o.get("fields").get("description", "")
-    return description if description else ""
+# per-text time budget of the markup grammar in seconds (see set_time_budget()); 0 means no limit
+time_budget = 0.0
 
 
-def extract_status(o: dict) -> str:
-    status = o.get("fields").get("status")
-    return status.get("name", "") if status else ""
+class ConversionTimeout(Exception):
+    """The markup grammar ran out of the per-text time budget
+    """
+    pass
 
 
-def extract_issue_type(o: dict) -> str:
-    issuetype = o.get("fields").get("issuetype")
-    return issuetype.get("name", "") if issuetype else ""
+class Attachment(object):
+    """A version of an attached file
+    """
+    __slots__ = ("id", "filename", "created", "content", "mime_type", "size")
 
+    def __init__(self, id: str, filename: str, created: str, content: str, mime_type: str, size: int):
+        self.id = id
+        self.filename = filename
+        self.created = created
+        self.content = content
+        self.mime_type = mime_type
+        self.size = size
 
-def extract_reporter(o: dict) -> tuple[str, str]:
-    reporter = o.get("fields").get("reporter")
-    name = reporter.get("name", "") if reporter else ""
-    disp_name = reporter.get("displayName", "") if reporter else ""
-    return (name, disp_name)
 
+class Comment(object):
+    __slots__ = ("author_name", "author_dispname", "body", "created", "updated")
 
-def extract_assignee(o: dict) -> tuple[str, str]:
-    assignee = o.get("fields").get("assignee")
-    name = assignee.get("name", "") if assignee else ""
-    disp_name = assignee.get("displayName", "") if assignee else ""
-    return (name, disp_name)
+    def __init__(self, author_name: str, author_dispname: str, body: str, created: str, updated: str):
+        self.author_name = author_name
+        self.author_dispname = author_dispname
+        self.body = body
+        self.created = created
+        self.updated = updated
 
 
-def extract_created(o: dict) -> str:
-    return o.get("fields").get("created", "")
+class JiraIssue(object):
+    """Fields of a Jira issue dump used by the migration scripts
 
+    Built by parse_issue() in a single pass over the dump; the converter, the dump index and the analytics read issues only through this model.
+    Timestamps are kept as they are in the dump ("" if the field is missing, None if it is null).
+    """
+    __slots__ = ("key", "summary", "description", "status", "issue_type", "reporter", "assignee", "created", "updated", "resolutiondate",
+                 "fix_versions", "versions", "components", "attachments", "issue_links", "subtasks", "comments", "comment_total", "worklogs",
+                 "rendered_description", "rendered_comments")
+
+    def __init__(self, key: str, summary: str, description: str, status: str, issue_type: str, reporter: tuple[str, str], assignee: tuple[str, str],
+                 created: str, updated: str, resolutiondate: str, fix_versions: list[str], versions: list[str], components: list[str],
+                 attachments: list[Attachment], issue_links: list[str], subtasks: list[str], comments: list[Comment], comment_total: int, worklogs: list[dict],
+                 rendered_description: Optional[str], rendered_comments: Optional[list[str]]):
+        self.key = key
+        self.summary = summary
+        self.description = description
+        self.status = status
+        self.issue_type = issue_type
+        # (name, display name)
+        self.reporter = reporter
+        self.assignee = assignee
+        self.created = created
+        self.updated = updated
+        self.resolutiondate = resolutiondate
+        self.fix_versions = fix_versions
+        self.versions = versions
+        self.components = components
+        # all versions of all attached files with complete metadata
+        self.attachments = attachments
+        self.issue_links = issue_links
+        self.subtasks = subtasks
+        self.comments = comments
+        # number of comments in Jira (the dump may contain fewer)
+        self.comment_total = comment_total
+        # as they are in the dump; only the converter reads them (see activity())
+        self.worklogs = worklogs
+        # server-rendered HTML; available only if the issue was downloaded with `expand=renderedFields`
+        self.rendered_description = rendered_description
+        # in the same order as `comments`
+        self.rendered_comments = rendered_comments
+
+    def attachment_files(self) -> list[tuple[Attachment, int]]:
+        """The latest version of each attached file and the number of its versions
+        """
+        return latest_attachments(self.attachments)
+
+    def activity(self) -> tuple[list[str], list[tuple[str, str]], list[str]]:
+        """Pull request URLs, git commits (repository, hash) and SVN revisions recorded by the ASF bots (see extract_activity())
+
+        Not computed by parse_issue(), so that the index and the analytics do not pay for the scan.
+        """
+        return extract_activity(self.worklogs, self.comments)
+
+
+# Jira fields read by parse_issue(); the downloader requests only these fields
+JIRA_FIELDS = {
+    "summary", "description", "status", "issuetype", "reporter", "assignee", "created", "updated", "resolutiondate",
+    "fixVersions", "versions", "components", "attachment", "issuelinks", "subtasks", "comment", "worklog",
+}
+
+
+def parse_issue(o: dict) -> JiraIssue:
+    """Read a Jira issue dump into a JiraIssue; this is the only place that knows the dump layout
+    """
+    fields = o.get("fields") or {}
+    status = fields.get("status")
+    issue_type = fields.get("issuetype")
 
-def extract_updated(o: dict) -> str:
-    return o.get("fields").get("updated", "")
+    issue_links = []
+    for link in fields.get("issuelinks") or []:
+        key = link.get("outwardIssue", {}).get("key")
+        if key:
+            issue_links.append(key)
+        key = link.get("inwardIssue", {}).get("key")
+        if key:
+            issue_links.append(key)
+
+    comment = fields.get("comment") or {}
+    comments = []
+    for c in comment.get("comments") or []:
+        author = c.get("author") or {}
+        comments.append(Comment(author.get("name", ""), author.get("displayName", ""), c.get("body", ""), c.get("created", ""), c.get("updated", "")))
+
+    rendered = o.get("renderedFields")
+    rendered_description = None
+    rendered_comments = None
+    if rendered:
+        rendered_description = rendered.get("description") or ""
+        if rendered.get("comment"):
+            rendered_comments = [c.get("body", "") for c in rendered.get("comment").get("comments", [])]
+
+    return JiraIssue(
+        key=o.get("key", ""),
+        summary=fields.get("summary") or "",
+        description=fields.get("description") or "",
+        status=status.get("name", "") if status else "",
+        issue_type=issue_type.get("name", "") if issue_type else "",
+        reporter=user_names(fields.get("reporter")),
+        assignee=user_names(fields.get("assignee")),
+        created=fields.get("created", ""),
+        updated=fields.get("updated", ""),
+        resolutiondate=fields.get("resolutiondate", ""),
+        fix_versions=[x.get("name", "") for x in fields.get("fixVersions") or []],
+        versions=[x.get("name", "") for x in fields.get("versions") or []],
+        components=[x.get("name", "") for x in fields.get("components") or []],
+        attachments=[a for a in map(attachment, fields.get("attachment") or []) if a],
+        issue_links=issue_links,
+        subtasks=[x.get("key", "") for x in fields.get("subtasks") or []],
+        comments=comments,
+        comment_total=comment.get("total", len(comments)),
+        worklogs=(fields.get("worklog") or {}).get("worklogs") or [],
+        rendered_description=rendered_description,
+        rendered_comments=rendered_comments,
+    )
+
+
+def user_names(user: Optional[dict]) -> tuple[str, str]:
+    if not user:
+        return ("", "")
+    return (user.get("name", ""), user.get("displayName", ""))
+
+
+def attachment(a: dict) -> Optional[Attachment]:
+    id = a.get("id")
+    filename = a.get("filename")
+    created = a.get("created")
+    content = a.get("content")
+    mime_type = a.get("mimeType")
+    if not (id and filename and created and content and mime_type):
+        return None
+    return Attachment(id=id, filename=filename, created=created, content=content, mime_type=mime_type, size=a.get("size", 0))
+
+
+def latest_attachments(attachments: list[Attachment]) -> list[tuple[Attachment, int]]:
+    """Select the latest version of each attached file; returns (latest version, number of versions) in the order of first appearance
+    """
+    files: dict[str, Attachment] = {}
+    counts: dict[str, int] = defaultdict(int)
+    for a in attachments:
+        if a.filename not in files or a.created > files[a.filename].created:
+            files[a.filename] = a
+        counts[a.filename] += 1
+    return [(a, counts[name]) for (name, a) in files.items()]
 
 
-def extract_resolutiondate(o: dict) -> str:
-    return o.get("fields").get("resolutiondate", "")
+def extract_activity(worklogs: list[dict], comments: list[Comment]) -> tuple[list[str], list[tuple[str, str]], list[str]]:
+    """Pull request URLs, git commits (repository, hash) and SVN revisions recorded by the ASF bots in the worklogs and comments
 
+    Each text is scanned once for all kinds of references; every reference is kept (not only the last one in a text),
+    in the order of first appearance and without duplicates.
+    """
+    pull_requests: dict[str, None] = {}
+    commits: dict[tuple[str, str], None] = {}
+    svn_revisions: dict[str, None] = {}
+
+    def scan(text: str):
+        for m in REGEX_ACTIVITY.finditer(text):
+            if m.group("pr"):
+                pull_requests[m.group("pr")] = None
+            elif m.group("commit"):
+                commits[(m.group("commit_repo"), m.group("commit"))] = None
+            else:
+                svn_revisions[m.group("svn")] = None
 
-def extract_fixversions(o: dict) -> list[str]:
-    return [x.get("name", "") for x in o.get("fields").get("fixVersions", [])]
+    for wl in worklogs:
+        if (wl.get("author") or {}).get("name", "") in ACTIVITY_BOTS and wl.get("comment"):
+            scan(wl.get("comment"))
+    for c in comments:
+        if c.author_name in ACTIVITY_BOTS and c.body:
+            scan(c.body)
+    return (list(pull_requests), list(commits), list(svn_revisions))
+
+
+# Jira accounts of the bots that record pull requests ("ASF GitHub Bot") and commits ("ASF subversion and git services", "Commit Tag Bot")
+ACTIVITY_BOTS = {"githubbot", "jira-bot", "commit-tag-bot"}
+# pull request URLs of the lucene and the old lucene-solr repository, SVN revision URLs and git commit notices ("Commit <hash> in lucene's branch ...");
+# the lookahead lets the regex engine skip to the possible first characters instead of trying every alternative at each position
+REGEX_ACTIVITY = re.compile(
+    r"(?=[hC])(?:(?P<pr>https://github\.com/apache/(?:lucene|lucene-solr)/pull/\d+)"
+    r"|https?://svn\.apache\.org/(?:r|viewvc\?view=rev(?:ision)?&(?:amp;)?rev(?:ision)?=)(?P<svn>\d+)"
+    r"|Commit (?P<commit>[0-9a-f]{40}) in (?P<commit_repo>[\w.-]+)'s branch)")
+REGEX_JIRA_KEY = re.compile(r"[^/]LUCENE-\d+")
+REGEX_MENTION = re.compile(r"@\w+")
+REGEX_LINK = re.compile(r"\[([^\]]+)\]\(([^\)]+)\)")
+REGEX_LINK_OR_MENTION = re.compile(r"(!?)\[([^\]]+)\]\(([^\)]+)\)|(@\w+)")
+# link target that is only a file name: an attachment link ([^file] in Jira markup, /secure/attachment/... in HTML) that is not in the attachment map
+REGEX_BARE_FILENAME = re.compile(r"^[^/:#?]+$")
+# anything that may start an element of the jira2markdown grammar (deliberately loose; a false positive only costs a full parse):
+# characters that are always markup, "??" and "\\", list bullets/headings/quotes at line start,
+# dashes, a "-" not inside a word followed by another "-" in the line (strikethrough) and pairs of "!", "+", "^", "~" in a line
+REGEX_MARKUP_TOKEN = re.compile(r"[*{\[|]|\?\?|\\\\|--|^[ \t]*(?:[#-]|h[1-6]\.|bq\.)|(?<!\w)-[^\n]*-|([!+^~])[^\n]*\1", re.MULTILINE)
 
 
-def extract_versions(o: dict) -> list[str]:
-    return [x.get("name", "") for x in o.get("fields").get("versions", [])]
+class MarkupGrammar(object):
+    """jira2markdown grammar that is built once and reused for all texts
 
+    `jira2markdown.convert()` builds the whole pyparsing grammar on every call. The only state kept by the grammar
+    between parses is the indentation of lists, which is reset before each conversion. Not thread-safe.
+    """
+    def __init__(self):
+        elements = MarkupElements()
+        inline_markup = Forward()
+        markup = Forward()
+        self.lists: list[MarkupList] = []
 
-def extract_components(o: dict) -> list[str]:
-    return [x.get("name", "") for x in o.get("fields").get("components", [])]
+        def expr(element_types) -> MatchFirst:
+            instances = [e(inline_markup=inline_markup, markup=markup, usernames={}) for e in element_types]
+            self.lists.extend(x for x in instances if isinstance(x, MarkupList))
+            return MatchFirst([x.expr for x in instances])
 
+        inline_markup << expr(filter(lambda e: e.is_inline_element, elements))
+        markup << expr(elements)
+        self.markup = markup
 
-def extract_attachments(o: dict) -> list[tuple[str, int]]:
-    attachments = o.get("fields").get("attachment")
-    if not attachments:
-        return []
-    files = {}
-    counts = defaultdict(int)
-    for a in attachments:
-        filename = a.get("filename")
-        created = a.get("created")
-        content = a.get("content")
-        mime_type = a.get("mimeType")
-        if not (filename and created and content and mime_type):
-            continue
-        if filename not in files or created > files[filename].created:
-            files[filename] = Attachment(filename=filename, created=created, content=content, mime_type=mime_type)
-        counts[filename] += 1
-    result = []
-    for name in files.keys():
-        result.append((name, counts[name]))
-    return result
-
-
-def extract_issue_links(o: dict) -> list[str]:
-    issue_links = o.get("fields").get("issuelinks", [])
-    if not issue_links:
-        return []
-
-    res = []
-    for link in issue_links:
-        key = link.get("outwardIssue", {}).get("key")
-        if key:
-            res.append(key)
-        key = link.get("inwardIssue", {}).get("key")
-        if key:
-            res.append(key)
-    return res
+    def convert(self, text: str) -> str:
+        for x in self.lists:
+            x.indent_state.reset()
+        return self.markup.transformString(text)
 
 
-def extract_subtasks(o: dict) -> list[str]:
-    return [x.get("key", "") for x in o.get("fields").get("subtasks", [])]
+@functools.lru_cache(maxsize=None)
+def markup_grammar() -> MarkupGrammar:
+    return MarkupGrammar()
 
 
-def extract_comments(o: dict) -> list[str, str, str, str, str]:
-    comments = o.get("fields").get("comment", {}).get("comments", [])
-    if not comments:
-        return []
-    res = []
-    for c in comments:
-        author = c.get("author")
-        name = author.get("name", "") if author else ""
-        disp_name = author.get("displayName", "") if author else ""
-        body = c.get("body", "")
-        created = c.get("created", "")
-        updated = c.get("updated", "")
-        res.append((name, disp_name, body, created, updated))
-    return res
-
-
-def extract_pull_requests(o: dict) -> list[str]:
-    worklogs = o.get("fields").get("worklog", {}).get("worklogs", [])
-    if not worklogs:
-        return []
-    res = []
-    for wl in worklogs:
-        if wl.get("author").get("name", "") != "githubbot":
-            continue
-        comment: str = wl.get("comment", "")
-        if not comment:
-            continue
-        if "opened a new pull request" not in comment and not "opened a pull request" in comment:
-            continue
-        comment = comment.replace('\n', ' ')
-        # detect pull request url
-        matches = re.match(r".*(https://github\.com/apache/lucene/pull/\d+)", comment)
-        if matches:
-            res.append(matches.group(1))
-        # detect pull request url in old lucene-solr repo
-        matches = re.match(r".*(https://github\.com/apache/lucene-solr/pull/\d+)", comment)
-        if matches:
-            res.append(matches.group(1))     
-    return res
+def converter_version() -> str:
+    try:
+        lib_version = importlib.metadata.version("jira2markdown")
+    except importlib.metadata.PackageNotFoundError:
+        lib_version = "unknown"
+    return f"{CONVERTER_VERSION}/jira2markdown-{lib_version}"
 
 
-REGEX_JIRA_KEY = re.compile(r"[^/]LUCENE-\d+")
-REGEX_MENTION = re.compile(r"@\w+")
-REGEX_LINK = re.compile(r"\[([^\]]+)\]\(([^\)]+)\)")
+def set_convert_cache(cache: Optional[ConvertCache]):
+    """Use the cache for convert_text() and convert_html() in this process
+    """
+    global text_cache
+    text_cache = cache
+
+
+def set_time_budget(seconds: float):
+    """Limit the time the markup grammar spends on a text in this process; convert_text() raises ConversionTimeout when it is exceeded
+    """
+    global time_budget
+    time_budget = seconds
+
+
+@contextmanager
+def time_limit(seconds: float):
+    """Raise ConversionTimeout if the block runs longer than the given seconds
+
+    The limit is enforced by SIGALRM, so it works only in the main thread (process pool workers run tasks in their main thread)
+    and is not enforced elsewhere.
+    """
+    if seconds <= 0 or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def timeout(signum, frame):
+        raise ConversionTimeout(f"conversion took more than {seconds} seconds")
+
+    prev_handler = signal.signal(signal.SIGALRM, timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, prev_handler)
 
 
 def convert_text(text: str, att_replace_map: dict[str, str] = {}) -> str:
     """Convert Jira markup to Markdown
     """
-    def repl_att(m: re.Match):
-        res = m.group(0)
-        for src, repl in att_replace_map.items():
-            if m.group(2) == src:
-                res = f"[{m.group(1)}]({repl})"
-        return res
-
-    text = jira2markdown.convert(text)
-
-    # markup @ mentions with ``
-    mentions = re.findall(REGEX_MENTION, text)
-    if mentions:
-        mentions = set(mentions)
-        for m in mentions:
-            with_backtick = f"`{m}`"
-            text = text.replace(m, with_backtick)
-    
-    text = re.sub(REGEX_LINK, repl_att, text)
+    if text_cache:
+        return text_cache.cached("markup", text, att_replace_map, _convert_text)
+    return _convert_text(text, att_replace_map)
 
-    return text
+
+def _convert_text(text: str, att_replace_map: dict[str, str]) -> str:
+    if has_markup(text):
+        markup_stats["markup"] += 1
+        with time_limit(time_budget):
+            text = markup_grammar().convert(text)
+    else:
+        # the grammar leaves markup-free text as is (the only escaping it does is for "*")
+        markup_stats["plain"] += 1
+    return postprocess_markdown(text, att_replace_map)
+
+
+def has_markup(text: str) -> bool:
+    """Cheap pre-scan for Jira markup; texts without markup skip the grammar
+    """
+    return REGEX_MARKUP_TOKEN.search(text) is not None
+
+
+def convert_html(html: str, att_replace_map: dict[str, str] = {}) -> str:
+    """Convert Jira rendered HTML (`renderedFields`) to Markdown
+    """
+    if text_cache:
+        return text_cache.cached("html", html, att_replace_map, _convert_html)
+    return _convert_html(html, att_replace_map)
+
+
+def _convert_html(html: str, att_replace_map: dict[str, str]) -> str:
+    text = html_to_markdown(html)
+    return postprocess_markdown(text, att_replace_map)
+
+
+def postprocess_markdown(text: str, att_replace_map: dict[str, str] = {}) -> str:
+    """Quote @ mentions with `` and replace links to attachments in converted Markdown
+
+    Links and images of attachments that are not in the map (e.g., excluded by the attachment plan) become their plain label,
+    since a bare file name resolves to nothing on GitHub.
+    This is a single left-to-right pass; each mention is quoted exactly once, even if it is a prefix of another mention.
+    """
+    if "@" not in text and "](" not in text:
+        return text
+
+    def repl(m: re.Match):
+        mention = m.group(4)
+        if mention:
+            return f"`{mention}`"
+        (image, label, url) = (m.group(1), m.group(2), m.group(3))
+        if "@" in label:
+            label = REGEX_MENTION.sub(quote_mention, label)
+        att_url = att_replace_map.get(url)
+        if att_url:
+            return f"{image}[{label}]({att_url})"
+        if REGEX_BARE_FILENAME.match(url):
+            return label
+        if "@" in url:
+            url = REGEX_MENTION.sub(quote_mention, url)
+        return f"{image}[{label}]({url})"
+
+    return REGEX_LINK_OR_MENTION.sub(repl, text)
+
+
+def raw_block(text: str) -> str:
+    """Markdown code block that shows the text as is
+    """
+    fence = "```"
+    while fence in text:
+        fence += "`"
+    return f"{fence}\n{text}\n{fence}"
+
+
+def quote_mention(m: re.Match) -> str:
+    return f"`{m.group(0)}`"
 
 
 def embed_gh_issue_link(text: str, issue_id_map: dict[str, str]) -> str:
@@ -0,0 +1,53 @@
+from pathlib import Path
+from typing import Any, Union
+import json
+
+
+# optional faster backend (`pip install orjson`); the standard json module is used if it is not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def backend() -> str:
+    return "orjson" if orjson else "json"
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    if orjson:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is stricter (e.g., lone surrogates in escapes); the standard module decides
+            pass
+    return json.loads(data)
+
+
+def dumps(o: Any, pretty: bool = False) -> bytes:
+    """Encode to UTF-8 JSON; pretty output is indented by two spaces, compact output has no whitespace
+
+    Non-ASCII characters are not escaped unless a string cannot be encoded to UTF-8 (a lone surrogate from Jira text);
+    the whole object is then encoded with ASCII escapes, which `loads()` reads back to the same object.
+    """
+    if orjson:
+        try:
+            return orjson.dumps(o, option=(orjson.OPT_INDENT_2 if pretty else 0) | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # e.g., integers over 64 bits or lone surrogates
+            pass
+    kwargs = {"indent": 2} if pretty else {"separators": (",", ":")}
+    try:
+        return json.dumps(o, ensure_ascii=False, **kwargs).encode("utf-8")
+    except UnicodeEncodeError:
+        return json.dumps(o, ensure_ascii=True, **kwargs).encode("ascii")
+
+
+def load_file(path: Path) -> Any:
+    with open(path, "rb") as fp:
+        return loads(fp.read())
+
+
+def dump_file(path: Path, o: Any, pretty: bool = False):
+    with open(path, "wb") as fp:
+        fp.write(dumps(o, pretty))
@@ -0,0 +1,111 @@
+#
+# Plan attachment downloads: report attachment sizes and exclude attachments by policies before downloading them
+# Usage:
+#   python src/plan_attachments.py
+#   python src/plan_attachments.py --max-size 10MB --deny-mime "application/octet-stream" "application/x-gzip"
+#   python src/plan_attachments.py --min <min issue number> --max <max issue number> --allow-mime "text/*" "image/*" --probe
+#
+
+import argparse
+from pathlib import Path
+from collections import Counter, defaultdict
+import sys
+
+from common import LOG_DIRNAME, JIRA_DUMP_DIRNAME, ATTACHMENT_PLAN_FILENAME, logging_setup, jira_issue_id, RateLimiter
+from dump_store import open_jira_dump_store
+from dump_index import entry_attachments, open_synced_index
+from jira_util import latest_attachments
+from http_util import RequestStats
+from attachment_plan import REASON_OLDER_VERSION, AttachmentPlan, AttachmentPolicy, parse_size, format_size, probe_size
+
+log_dir = Path(__file__).resolve().parent.parent.joinpath(LOG_DIRNAME)
+logger = logging_setup(log_dir, "plan_attachments")
+
+PROBE_RATE = 2.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--issues', type=int, required=False, nargs='*', help='Jira issue number list to be planned')
+    parser.add_argument('--min', type=int, dest='min', required=False, help='Minimum Jira issue number to be planned')
+    parser.add_argument('--max', type=int, dest='max', required=False, help='Maximum Jira issue number to be planned')
+    parser.add_argument('--max-size', type=str, dest='max_size', required=False, help='Skip attachments larger than this (e.g. "500K", "10MB")')
+    parser.add_argument('--allow-mime', type=str, dest='allow_mime', required=False, nargs='*', default=[], help='Download only attachments of these MIME types (wildcards allowed, e.g. "text/*")')
+    parser.add_argument('--deny-mime', type=str, dest='deny_mime', required=False, nargs='*', default=[], help='Skip attachments of these MIME types (wildcards allowed)')
+    parser.add_argument('--probe', action='store_true', help='Get sizes missing in the Jira metadata by HEAD requests')
+    parser.add_argument('--top', type=int, dest='top', required=False, default=20, help='Number of the largest issues to be reported')
+    args = parser.parse_args()
+
+    dump_dir = Path(__file__).resolve().parent.parent.joinpath(JIRA_DUMP_DIRNAME)
+    if not dump_dir.exists():
+        logger.error(f"Jira dump dir not exists: {dump_dir}")
+        sys.exit(1)
+    # the attachment metadata of all issues are in the dump index
+    index = open_synced_index(dump_dir, open_jira_dump_store(dump_dir))
+
+    if args.issues:
+        issues = args.issues
+    else:
+        issues = [num for num in index.numbers() if (args.min is None or num >= args.min) and (args.max is None or num <= args.max)]
+
+    policy = AttachmentPolicy(max_size=parse_size(args.max_size) if args.max_size else None, allow_mime=args.allow_mime, deny_mime=args.deny_mime)
+    plan = AttachmentPlan(dump_dir.joinpath(ATTACHMENT_PLAN_FILENAME))
+    plan.policy = {"max_size": policy.max_size, "allow_mime": policy.allow_mime, "deny_mime": policy.deny_mime}
+    # re-plan the given issues from scratch
+    for num in issues:
+        plan.skipped.pop(str(num), None)
+    limiter = RateLimiter(PROBE_RATE)
+    probe_stats = RequestStats()
+
+    issue_bytes: Counter = Counter()
+    issue_planned_bytes: Counter = Counter()
+    mime_counts: dict[str, Counter] = defaultdict(Counter)
+    reason_counts: dict[str, Counter] = defaultdict(Counter)
+    probed = 0
+    for num in issues:
+        entry = index.get(num)
+        if not entry:
+            continue
+        attachments = entry_attachments(entry)
+        latest = set(a.id for (a, _) in latest_attachments(attachments))
+        for a in attachments:
+            if not a.size and args.probe:
+                a.size = probe_size(a, limiter, probe_stats, logger)
+                probed += 1
+            issue_bytes[num] += a.size
+            mime_counts[a.mime_type]["files"] += 1
+            mime_counts[a.mime_type]["bytes"] += a.size
+            if a.id not in latest:
+                # the downloader fetches only the latest version of each file name
+                reason = REASON_OLDER_VERSION
+            else:
+                reason = policy.skip_reason(a)
+                if reason:
+                    plan.skip(num, a, reason)
+            if reason:
+                reason_counts[reason.split(", ")[0]]["files"] += 1
+                reason_counts[reason.split(", ")[0]]["bytes"] += a.size
+                mime_counts[a.mime_type]["skipped_bytes"] += a.size
+            else:
+                issue_planned_bytes[num] += a.size
+
+    plan.save()
+
+    total = sum(issue_bytes.values())
+    planned = sum(issue_planned_bytes.values())
+    logger.info(f"Issues: {len(issues)}, attachments: {sum(x['files'] for x in mime_counts.values())} ({format_size(total)}), to be downloaded: {format_size(planned)}" + (f", probed: {probed}" if args.probe else ""))
+    for (reason, x) in sorted(reason_counts.items()):
+        logger.info(f"Skipped ({reason}): {x['files']} files ({format_size(x['bytes'])})")
+    logger.info("By MIME type:")
+    for (mime_type, x) in sorted(mime_counts.items(), key=lambda item: item[1]["bytes"], reverse=True):
+        logger.info(f"  {mime_type}: {x['files']} files, {format_size(x['bytes'])} (skipped {format_size(x['skipped_bytes'])})")
+    logger.info(f"Largest {args.top} issues:")
+    for (num, nbytes) in issue_bytes.most_common(args.top):
+        logger.info(f"  {jira_issue_id(num)}: {format_size(nbytes)} (to be downloaded {format_size(issue_planned_bytes[num])})")
+    if probed:
+        summary = probe_stats.summary()
+        x = summary["requests"]["attachment"]
+        logger.info(f"Probe requests: {x['count']}, latency p50={x['latency_sec']['p50']} sec, p95={x['latency_sec']['p95']} sec, status codes={x['status_codes']}, "
+                    f"rate limit wait={summary['waits_sec'].get('rate_limit', 0)} sec")
+    logger.info(f"Attachment plan was written in {plan.plan_file}")
+    logger.info("Done.")